@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from util.voc_reader import read_label_file, read_label_file_etree
+
+
+def benchmark(reader, label_files, repeat):
+    """ Returns the best throughput in files/s over all repetitions and the results of the last one.
+    """
+
+    best = None
+    results = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [reader(label_file) for label_file in label_files]
+        duration = time.perf_counter() - start
+
+        if best is None or duration < best:
+            best = duration
+
+    return len(label_files) / best, results
+
+
+def corrupt_label_files(label_files, path, num_files=10):
+    """ Writes a truncated copy (cut after the last object) and a copy with a mismatched closing tag of the first label
+    files to path.
+    :return: List of the written label files
+    """
+
+    corrupt_files = []
+
+    for label_file in label_files[:num_files]:
+        with open(label_file, 'rb') as f:
+            data = f.read()
+
+        name = os.path.splitext(os.path.basename(label_file))[0]
+        end = data.rfind(b'</object>')
+        variants = {'truncated': data[:end + len(b'</object>')] if end >= 0 else data[:len(data) // 2],
+                    'mismatched': data.replace(b'</filename>', b'</filenam>', 1)}
+
+        for variant, variant_data in variants.items():
+            corrupt_file = os.path.join(path, '{}_{}.xml'.format(name, variant))
+            with open(corrupt_file, 'wb') as f:
+                f.write(variant_data)
+            corrupt_files.append(corrupt_file)
+
+    return corrupt_files
+
+
+def read_or_error(reader, label_file):
+    """ Returns the result of the reader or the type of the raised error.
+    """
+
+    try:
+        return reader(label_file)
+    except Exception as e:
+        return type(e)
+
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser = argparse.ArgumentParser(description='Compares the fast path VOC reader with ElementTree.')
+
+    parser.add_argument('--label-path', help='Path to label directory.',
+                        type=str, required=True)
+    parser.add_argument('--max-files', help='Maximum number of label files to read. (default: 10000)',
+                        type=int, default=10000)
+    parser.add_argument('--repeat', help='Number of repetitions, the best one is reported. (default: 3)',
+                        type=int, default=3)
+
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args(sys.argv[1:])
+
+    label_files = sorted(file for file in os.listdir(args.label_path) if file.endswith('.xml'))[:args.max_files]
+    label_files = [os.path.join(args.label_path, label_file) for label_file in label_files]
+
+    avg_size = sum(os.path.getsize(label_file) for label_file in label_files) / max(1, len(label_files))
+    print('Reading {} label files with an average size of {:.1f} KB ...'.format(len(label_files), avg_size / 1024))
+
+    etree_throughput, etree_results = benchmark(read_label_file_etree, label_files, args.repeat)
+    fast_throughput, fast_results = benchmark(read_label_file, label_files, args.repeat)
+
+    mismatches = [label_file for label_file, etree_result, fast_result in zip(label_files, etree_results, fast_results)
+                  if etree_result != fast_result]
+
+    print(tabulate([('ElementTree', etree_throughput, 1.0),
+                    ('Fast path', fast_throughput, fast_throughput / etree_throughput)],
+                   headers=['Reader', 'files/s', 'speedup'], tablefmt='psql', floatfmt='.1f'))
+
+    # Truncated or corrupt label files have to raise the same error with both readers
+    with tempfile.TemporaryDirectory() as path:
+        corrupt_files = corrupt_label_files(label_files, path)
+        mismatches += [os.path.basename(label_file) for label_file in corrupt_files
+                       if read_or_error(read_label_file_etree, label_file) != read_or_error(read_label_file, label_file)]
+
+    if len(mismatches) > 0:
+        print('Results differ for {} label files, e.g. {}'.format(len(mismatches), mismatches[0]))
+        sys.exit(-1)
+
+
+if __name__ == '__main__':
+    main()
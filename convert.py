@@ -4,6 +4,10 @@ import sys
 
 import converters
 from label_mapping import mapping_settings
+from util.io_order import IO_ORDERS
+from util.materialize import MODES as MATERIALIZE_MODES
+from util.transcode import BACKENDS as TRANSCODE_BACKENDS, CHROMA_SUBSAMPLING
+from util.util import default_cache_file
 
 
 def check_args(args):
@@ -109,18 +113,64 @@ def check_args(args):
                                        ' either \'combine_by_substring\' and \'combine_by_id\'.'
         assert 'new_labels' in args.mapping, 'No new labels defined in \'label_mapping.py\' file.'
 
-    if args.skip_images_without_label and args.target_format == 'coco':
-        print('Skipping images without labels works only for COCO datsets.')
-
     if args.exclude_area is not None:
         assert args.exclude_area > 0, 'Area to exclude must be greater than 0.'
 
+    assert args.workers >= 1, 'Number of workers must be at least 1.'
+    assert args.io_workers >= 1, 'Number of I/O workers must be at least 1.'
+    assert 0 <= args.fan_out <= 4, 'Fan-out must be between 0 and 4 levels.'
+
+    assert args.resize is None or args.max_side is None, 'Please use either --resize or --max-side.'
+    assert not args.letterbox or args.resize is not None, 'Letterbox needs a size given by --resize.'
+    if args.resize is not None:
+        assert min(args.resize) > 0, 'Size to resize to must be greater than 0.'
+    if args.max_side is not None:
+        assert args.max_side > 0, 'Maximum side must be greater than 0.'
+    if args.target_format == 'tfrecord' and (args.resize is not None or args.max_side is not None):
+        assert not args.no_copy, 'The records are created from the resized images, please don\'t use --no-copy.'
+    assert 1 <= args.jpeg_quality <= 100, 'JPEG quality must be between 1 and 100.'
+    assert 0 <= args.png_compression <= 9, 'PNG compression level must be between 0 and 9.'
+    assert args.stats_img_tolerance > 0, 'Tolerance of the image statistics must be greater than 0.'
+
+    assert not (args.validate_only and args.no_preflight), 'Please don\'t use the flags --validate-only and' \
+                                                           ' --no-preflight at the same time.'
+
+    if args.quarantine_list is not None:
+        assert os.path.isfile(args.quarantine_list), 'Quarantine list not found at: {}'.format(args.quarantine_list)
+
+    if args.clear_label_cache and args.label_cache is None:
+        args.label_cache = ''
+
+    if args.label_cache == '':
+        args.label_cache = default_cache_file(args.label_path)
+
+    if args.image_store is not None:
+        args.image_store = os.path.abspath(args.image_store)
+
+        # The store is keyed by the content hashes of the catalog
+        if args.image_catalog is None:
+            args.image_catalog = ''
+
+    if args.image_catalog == '':
+        args.image_catalog = default_cache_file(args.image_path, '_images')
+
+    if args.moment_cache == '':
+        args.moment_cache = default_cache_file(args.image_path, '_moments')
+
     return args
 
 
-def parse_args(args):
-    """ Parse the arguments.
+def add_missing_defaults(args):
+    """ Sets all arguments missing in args to their default value, e.g. when main() is called with an older Namespace.
     """
+    for action in get_parser()._actions:
+        if action.dest != 'help' and action.dest not in args:
+            setattr(args, action.dest, action.default)
+
+    return args
+
+
+def get_parser():
     parser = argparse.ArgumentParser()
 
     # Path settings
@@ -159,23 +209,84 @@ def parse_args(args):
                                                             'when show reqNone source type will be used. '
                                                             '(default: None)',
                               type=str, default=None)
+    image_parser.add_argument('--resize', help='Resizes all images to the given width and height (e.g. "--resize 608'
+                                               ' 608"), boxes are scaled accordingly. (default: None)',
+                              type=int, nargs=2, default=None)
+    image_parser.add_argument('--letterbox', help='Keeps the aspect ratio with --resize and pads the images to the'
+                                                  ' given size.',
+                              action='store_const', const=True, default=False)
+    image_parser.add_argument('--max-side', help='Downscales all images whose longer side exceeds the given size,'
+                                                 ' boxes are scaled accordingly. (default: None)',
+                              type=int, default=None)
+    image_parser.add_argument('--transcode-backend', help='Library used to transcode the images when the filetype'
+                                                          ' changes, cv2 uses libjpeg-turbo and is faster for JPEG.'
+                                                          ' (default: pil)',
+                              type=str, choices=TRANSCODE_BACKENDS, default='pil')
+    image_parser.add_argument('--jpeg-quality', help='Quality of transcoded JPEG images (1-100). (default: 75)',
+                              type=int, default=75)
+    image_parser.add_argument('--png-compression', help='Compression level of transcoded PNG images (0-9).'
+                                                        ' (default: 6)',
+                              type=int, default=6)
+    image_parser.add_argument('--chroma-subsampling', help='Chroma subsampling of transcoded JPEG images.'
+                                                           ' (default: None, encoder default)',
+                              type=str, choices=CHROMA_SUBSAMPLING, default=None)
 
     # Optional settings
     optional_parser = parser.add_argument_group('Optional settings')
     optional_parser.add_argument('--no-copy', help='Do not copy the images when set',
                                  action='store_const', const=True, default=False)
     optional_parser.add_argument('--skip-images-without-label',
-                                 help='Do not copy the images without label when set. (COCO only)',
+                                 help='Skips all images without label (after excluding classes and small objects)'
+                                      ' when set. They are neither copied nor listed in any set.',
+                                 action='store_const', const=True, default=False)
+    optional_parser.add_argument('--workers', help='Number of processes used to parse the label files, to check,'
+                                                   ' transcode and resize the images and to calculate the image'
+                                                   ' statistics. (default: 1)',
+                                 type=int, default=1)
+    optional_parser.add_argument('--io-workers', help='Number of threads used to copy (or link) the images when the'
+                                                      ' filetype and size do not change, transcodes run on --workers.'
+                                                      ' The images are written while the labels are converted.'
+                                                      ' (default: 8)',
+                                 type=int, default=8)
+    optional_parser.add_argument('--materialize', help='Defines how images are placed in the output dirs when the'
+                                                       ' filetype does not change. Modes not supported by the file'
+                                                       ' system fall back to a copy. (default: copy)',
+                                 type=str, choices=MATERIALIZE_MODES, default='copy')
+    optional_parser.add_argument('--io-order', help='Order in which label files and images are read. "inode" and'
+                                                    ' "extent" read the files in disk order with readahead hints,'
+                                                    ' which avoids seeks on HDDs. The results keep the logical order.'
+                                                    ' (default: logical)',
+                                 type=str, choices=IO_ORDERS, default='logical')
+    optional_parser.add_argument('--check-images', help='Checks all images before the conversion (PNG chunk CRCs and'
+                                                        ' IEND, JPEG SOI and EOI), with "decode" every image is also'
+                                                        ' decoded. Invalid images are written to'
+                                                        ' \'quarantined_images.txt\' and skipped. (default: None,'
+                                                        ' when set without value structure)',
+                                 type=str, nargs='?', choices=['structure', 'decode'], const='structure', default=None)
+    optional_parser.add_argument('--quarantine-list', help='Skips all images in the given quarantine list, e.g. the'
+                                                           ' \'quarantined_images.txt\' of a previous run.',
+                                 type=str, default=None)
+    optional_parser.add_argument('--validate-only', help='Only checks all label files and writes the pre-flight report'
+                                                         ' \'preflight_report.json\' to the output path.',
+                                 action='store_const', const=True, default=False)
+    optional_parser.add_argument('--no-preflight', help='Skips the pre-flight check of all label files. The conversion'
+                                                        ' then stops at the first invalid label file.',
                                  action='store_const', const=True, default=False)
 
     # Optional path settings
     opt_path_parser = parser.add_argument_group('Optional path settings')
+    opt_path_parser.add_argument('--fan-out', help='Number of hashed sub dir levels inside each output set dir (e.g.'
+                                                   ' 2 for <set>/ab/cd/<file>) for very large sets. (default: 0)',
+                                 type=int, default=0)
     opt_path_parser.add_argument('--file-list-path', help='Path to the file lists. '
                                                           'A file list is a .txt file containing the filenames'
                                                           ' for each set without the file extension. (default: None)',
                                  type=str, default=None)
     opt_path_parser.add_argument('--file-lists', help='List of the file list filenames. (default: None)',
                                  type=str, nargs='*', default=None)
+    opt_path_parser.add_argument('--recursive', help='Searches images and label files in subdirectories of the image'
+                                                     ' and label path (e.g. shards) when set.',
+                                 action='store_const', const=True, default=False)
 
     # Optional dataset settings
     opt_dataset_parser = parser.add_argument_group('Optional dataset settings')
@@ -226,6 +337,24 @@ def parse_args(args):
                              action='store_const', const=True, default=False)
     stat_parser.add_argument('--stats-img', help='Calculate image statistics when set.',
                              action='store_const', const=True, default=False)
+    stat_parser.add_argument('--stats-img-approx', help='Estimates the image statistics from a random sample of'
+                                                        ' each set decoded at reduced resolution when set. Reports'
+                                                        ' 95%% confidence intervals.',
+                             action='store_const', const=True, default=False)
+    stat_parser.add_argument('--stats-img-tolerance', help='Sampling stops when the confidence intervals of all means'
+                                                           ' and stds are below this fraction of the estimates.'
+                                                           ' (--stats-img-approx only).',
+                             type=float, default=0.001)
+    stat_parser.add_argument('--stats-img-reduce', help='Downscale factor of the decode (--stats-img-approx only).'
+                                                        ' JPEG images are scaled while decoding, which is much faster'
+                                                        ' and keeps the mean, but the std is underestimated by the'
+                                                        ' detail lost in downscaling.',
+                             type=int, choices=[1, 2, 4, 8], default=1)
+    stat_parser.add_argument('--stats-img-percentiles', help='Writes percentiles, clipping and histograms of the'
+                                                             ' exact image statistics with --moment-cache, which'
+                                                             ' then caches the histogram of every image. Without'
+                                                             ' --moment-cache they are always written.',
+                             action='store_const', const=True, default=False)
     stat_parser.add_argument('--stats-label', help='Calculate label statistics when set.',
                              action='store_const', const=True, default=False)
     stat_parser.add_argument('--tablefmt', help="Various plain-text table formats (tablefmt) are supported.",
@@ -234,7 +363,44 @@ def parse_args(args):
                                       'presto', 'psql', 'rst', 'mediawiki', 'moinmoin', 'youtrack', 'html', 'latex',
                                       'latex_raw', 'latex_booktabs', 'tsv', 'textile'])
 
-    return check_args(parser.parse_args(args))
+    # Cache settings
+    cache_parser = parser.add_argument_group('Cache settings')
+    cache_parser.add_argument('--label-cache', help='Caches parsed label files and only parses new or changed label'
+                                                    ' files in later runs. Optionally takes the path to the cache'
+                                                    ' file. (default: None, when set without path'
+                                                    ' ~/.cache/data_converter/<label dir>_<hash>.npz)',
+                              type=str, nargs='?', const='', default=None)
+    cache_parser.add_argument('--image-catalog', help='Keeps a catalog of image sizes and content hashes read from the'
+                                                      ' image headers and checks the sizes in the label files against'
+                                                      ' it. Optionally takes the path to the catalog file. (default:'
+                                                      ' None, when set without path'
+                                                      ' ~/.cache/data_converter/<image dir>_<hash>_images.npz)',
+                              type=str, nargs='?', const='', default=None)
+    cache_parser.add_argument('--moment-cache', help='Caches the pixel count, sum and sum of squares of every'
+                                                     ' image, so the mean and std of any set or split only decode'
+                                                     ' new or changed images. With --stats-img-percentiles the cache'
+                                                     ' also holds the histogram of every image (about 3 KB per image'
+                                                     ' in memory instead of 56 bytes).'
+                                                     ' Optionally takes the path to the cache file. (default: None,'
+                                                     ' when set without path'
+                                                     ' ~/.cache/data_converter/<image dir>_<hash>_moments.npz)',
+                              type=str, nargs='?', const='', default=None)
+    cache_parser.add_argument('--image-store', help='Path to a content-addressed image store shared by all output'
+                                                    ' dirs. Images (also transcoded ones) are stored once and hard'
+                                                    ' linked into the output set dirs, enables --image-catalog.'
+                                                    ' Unused images are removed with gc_image_store.py.'
+                                                    ' (default: None)',
+                              type=str, default=None)
+    cache_parser.add_argument('--clear-label-cache', help='Removes the label cache before running, which rebuilds it.',
+                              action='store_const', const=True, default=False)
+
+    return parser
+
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    return check_args(get_parser().parse_args(args))
 
 
 def main(args=None):
@@ -243,7 +409,7 @@ def main(args=None):
         args = sys.argv[1:]
         args = parse_args(args)
     else:
-        check_args(args)
+        check_args(add_missing_defaults(args))
 
     if args.target_format == 'coco':
         converter = converters.COCOConverter(args)
@@ -258,6 +424,9 @@ def main(args=None):
 
     converter.init()
 
+    if args.validate_only:
+        return None
+
     if args.sets or args.file_lists:
         converter.split(args.sets, args.set_sizes, args.shuffle)
 
@@ -267,7 +436,7 @@ def main(args=None):
 
     if args.stats or args.stats_label:
         converter.calc_label_statistics(max_classes=206)
-    if args.stats or args.stats_img:
+    if args.stats or args.stats_img or args.stats_img_approx:
         converter.calc_img_statistics()
 
     return max_delta
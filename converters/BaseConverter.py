@@ -2,22 +2,41 @@ import copy
 import json
 import os
 import random
-import shutil
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from shutil import copyfile
 
-import cv2
 import numpy as np
 import pandas as pd
-from PIL import Image
 from tabulate import tabulate
 from tqdm import tqdm
 
-import converters
-from util.util import create_dir, validate_match, print_label_stats, print_warning_for_empty_classes, \
-    check_label_names_for_duplicates, find_value
+from util.annotation_store import AnnotationStore
+from util.dataset_index import DatasetIndex
+from util.discovery import scan_dir, pair_by_stem
+from util.image_catalog import ImageCatalog
+from util.image_check import check_images, read_quarantine_list, write_quarantine_list
+from util.image_pipeline import process_image
+from util.image_stats import calc_histogram, empty_histogram, estimate_mean_std, histogram_moments, histogram_stats, \
+    moments_mean_std, sample_moments
+from util.image_store import object_key, store_image, write_refs
+from util.io_order import READAHEAD_WINDOW, Readahead, disk_order, with_readahead
+from util.label_cache import LabelCache
+from util.manifest import diff_manifest, list_files, load_manifest, save_manifest
+from util.materialize import materialize_file
+from util.moment_cache import MomentCache
+from util.preflight import check_annotations, write_report, print_report
+from util.resize import image_geometry, resize_geometry, resize_settings
+from util.transcode import transcode_options
+from util.util import create_dir, create_fan_out_dirs, remove_empty_fan_out_dirs, print_label_stats, \
+    print_warning_for_empty_classes, check_label_names_for_duplicates, find_value
+
+
+# Values of the class id lookup table for objects which are dropped or have an unknown class id
+DROPPED_CLASS_ID = -1
+UNKNOWN_CLASS_ID = -2
 
 
 class BaseConverter:
@@ -47,6 +66,23 @@ class BaseConverter:
 
         self.images_copied = args.no_copy
         self.images_split = False
+        self.io_pool = None
+        self.transcode_pool = None
+        self.transcode_options = transcode_options(args)
+        self.resize_settings = resize_settings(args)
+        self.resize_geometry = None
+        self.pending_images = {}
+        self.transcoded_images = []
+        self.manifests = {}
+
+        # Histograms of the images decoded while converting, so the exact image statistics don't decode them again.
+        # They are summed per set, with --moment-cache they are added to the cache instead.
+        self.fuse_img_statistics = (args.stats or args.stats_img) and not args.stats_img_approx
+        self.set_histograms = {}
+        self.counted_images = None
+        self.moment_cache = None
+        if self.fuse_img_statistics and args.moment_cache is not None:
+            self.moment_cache = MomentCache(args.moment_cache, args.image_path, args.stats_img_percentiles)
         self.skip_images_without_label = args.skip_images_without_label
 
         '''Create class parameter
@@ -62,15 +98,22 @@ class BaseConverter:
         self.cat2id = {}
         self.id2cat = {}
         self.gt_boxes = {}
+        self.class_id_table = None
 
-        self.images = {}
-        self.label = {}
+        self.index = DatasetIndex(self.image_src_filetype, self.image_dest_filetype, fan_out=args.fan_out)
         self.image_sets = []
 
+        self.image_entries = {}
+        self.unmatched_images = []
+        self.unmatched_labels = []
+        self.missing_files = []
+
+        self.annotations = None
+        self.image_catalog = None
+        self.image_catalog_rows = None
         self.not_verified_label_files = []
 
         self.img_mean = []
-        self.img_var = []
         self.img_std = []
 
     def init(self):
@@ -115,7 +158,31 @@ class BaseConverter:
 
         self._fill_lists()
 
-        assert validate_match(self.image_sets, self.images, self.label), 'Image and label files do not match.'
+        self._check_unmatched_files()
+
+        if self.args.recursive:
+            self._check_duplicate_output_files()
+
+        if self.args.check_images is not None or self.args.quarantine_list is not None:
+            self._quarantine_images()
+
+        # Parse every label file once
+        parse_errors = None if self.args.no_preflight else []
+        self.annotations = self._load_annotations(self.index.label_files(), parse_errors)
+
+        self._compile_class_id_table()
+
+        if self.args.image_catalog is not None:
+            self._update_image_catalog()
+
+        if not self.args.no_preflight:
+            self._run_preflight(parse_errors)
+
+        if self.resize_settings is not None:
+            self._resize_annotations()
+
+        if self.skip_images_without_label:
+            self._skip_images_without_label()
 
     def _check_for_excluded_classes(self):
         create_dir(self.output_path)
@@ -390,6 +457,10 @@ class BaseConverter:
             f.write("\n")
 
     def _fill_lists(self):
+        image_entries = scan_dir(self.image_path, self.image_src_filetype, self.args.recursive)
+        label_entries = scan_dir(self.label_path, 'xml', self.args.recursive)
+        self.image_entries = image_entries
+
         if self.file_lists is not None:
             for file_list in self.file_lists:
                 lines = list(open(file_list))
@@ -397,62 +468,295 @@ class BaseConverter:
                 set_name = lines.pop(0).split('=')[1].rstrip("\n\r")
                 self.image_sets.append(set_name)
 
-                self.images[set_name] = ['{}.{}'.format(filename.rstrip("\n\r"), self.image_src_filetype) for filename
-                                         in
-                                         lines]
-                self.label[set_name] = ['{}.xml'.format(filename.rstrip("\n\r")) for filename in lines]
+                pairing = pair_by_stem(image_entries, label_entries, [line.rstrip("\n\r") for line in lines])
+                self._set_paired_lists(set_name, pairing)
 
             self.images_split = True
         else:
             self.image_sets = ['images']
+            self._set_paired_lists('images', pair_by_stem(image_entries, label_entries))
 
-            self.images['images'] = [file for file in os.listdir(self.image_path) if
-                                     file.endswith(self.image_src_filetype)]
-            self.label['images'] = [file for file in os.listdir(self.label_path) if file.endswith('.xml')]
+    def _set_paired_lists(self, image_set, pairing):
+        self.index.add_set(image_set, pairing.stems)
 
-    def calc_img_statistics(self):
-        print("Calculating image statistics ...")
+        self.unmatched_images.extend(pairing.unmatched_images)
+        self.unmatched_labels.extend(pairing.unmatched_labels)
+        self.missing_files.extend(pairing.missing)
+
+    def _check_unmatched_files(self):
+        if len(self.unmatched_images) + len(self.unmatched_labels) + len(self.missing_files) == 0:
+            return
+
+        unmatched_file = os.path.join(self.output_path, 'unmatched_files.txt')
+        with open(unmatched_file, 'w') as file:
+            for title, files in [('Images without label file', self.unmatched_images),
+                                 ('Label files without image', self.unmatched_labels),
+                                 ('Missing image and label file', self.missing_files)]:
+                if len(files) == 0:
+                    continue
+
+                print('\n{}: {}'.format(title, len(files)))
+                for path in files[:10]:
+                    print('\t' + path)
+                if len(files) > 10:
+                    print('\t...')
+
+                file.write('# {}\n'.format(title))
+                for path in files:
+                    file.write(path + '\n')
+
+        print('\nAll unmatched files written to {}'.format(unmatched_file))
+        assert False, 'Image and label files do not match.'
+
+    def _check_duplicate_output_files(self):
+        """ Images of different sub dirs (--recursive) with the same file name would be written to the same file of a
+        set dir, so they are listed and the program ends like for unmatched files.
+        """
+        output_files = {}
+        for stem_id in range(len(self.index)):
+            output_files.setdefault(self.index.output_file(stem_id), []).append(stem_id)
+
+        duplicates = [stem_ids for stem_ids in output_files.values() if len(stem_ids) > 1]
+        if len(duplicates) == 0:
+            return
 
-        mean_per_image = []
+        duplicate_file = os.path.join(self.output_path, 'duplicate_files.txt')
+        with open(duplicate_file, 'w') as file:
+            print('\nImages with the same file name in different sub dirs: {}'.format(len(duplicates)))
 
-        for s in self.image_sets:
+            for i, stem_ids in enumerate(duplicates):
+                paths = [os.path.join(self.image_path, self.index.image_file(stem_id)) for stem_id in stem_ids]
+
+                if i < 10:
+                    print('\t' + ', '.join(paths))
+                file.write('\t'.join(paths) + '\n')
+
+            if len(duplicates) > 10:
+                print('\t...')
+
+        print('\nAll duplicate file names written to {}'.format(duplicate_file))
+        assert False, 'File names of the images must be unique across the sub dirs.'
+
+    def _quarantine_images(self):
+        """ Removes all images of the given quarantine list and all images failing the image check from the sets.
+        """
+        keep = np.ones(len(self.index), dtype=bool)
+
+        if self.args.quarantine_list is not None:
+            quarantined = read_quarantine_list(self.args.quarantine_list)
+            keep = np.array([self.index.image_file(stem_id) not in quarantined for stem_id in range(len(self.index))],
+                            dtype=bool)
+
+        if self.args.check_images is not None:
+            checked = np.flatnonzero(keep)
+            issues = check_images(self.image_path, [self.index.image_file(stem_id) for stem_id in checked.tolist()],
+                                  self.args.workers, self.args.check_images == 'decode')
+
+            quarantine_file = os.path.join(self.output_path, 'quarantined_images.txt')
+            write_quarantine_list(quarantine_file, issues)
+
+            if len(issues) > 0:
+                print('\nInvalid images: {}'.format(len(issues)))
+                for image_file, _, message in issues[:10]:
+                    print('\t{}: {}'.format(image_file, message))
+                if len(issues) > 10:
+                    print('\t...')
+
+                print('All invalid images written to {}'.format(quarantine_file))
+
+            invalid = set(image_file for image_file, _, _ in issues)
+            keep[checked] = [self.index.image_file(stem_id) not in invalid for stem_id in checked.tolist()]
+
+        for image_set, stem_ids in self.index.sets.items():
+            self.index.sets[image_set] = stem_ids[keep[stem_ids]]
+
+        print('\nQuarantined images: {} of {} images are skipped.'.format(int((~keep).sum()), len(self.index)))
+
+    def _load_annotations(self, label_files, errors=None):
+        if self.args.label_cache is None:
+            return AnnotationStore.from_label_files(self.label_path, label_files, self.args.workers, errors,
+                                                    self.args.io_order)
+
+        label_cache = LabelCache(self.args.label_cache, self.label_path)
+
+        if self.args.clear_label_cache:
+            label_cache.clear()
+
+        return label_cache.load_annotations(label_files, self.args.workers, errors, self.args.io_order)
+
+    def _update_image_catalog(self):
+        self.image_catalog = ImageCatalog(self.args.image_catalog, self.image_path)
+        self.image_catalog_rows = self.image_catalog.update(
+            [self.index.image_file(stem_id) for stem_id in range(len(self.index))], self.args.workers,
+            [self.image_entries.get(stem) for stem in self.index.stems])
+
+    def _get_image_sizes(self):
+        """ Returns width and height of all images from the image catalog, None without catalog.
+        """
+        if self.image_catalog is None:
+            return None
+
+        return self.image_catalog.width[self.image_catalog_rows], self.image_catalog.height[self.image_catalog_rows]
+
+    def _run_preflight(self, parse_errors):
+        """ Checks all label files and writes one report before any dataset file is written.
+        """
+        issues = check_annotations(self.annotations, self.index, self.label_path,
+                                   self.class_id_table != UNKNOWN_CLASS_ID, parse_errors, self._get_image_sizes())
+
+        report = write_report(os.path.join(self.output_path, 'preflight_report.json'), issues,
+                              len(self.annotations), self.annotations.num_boxes)
+        print_report(report, self.args.tablefmt)
+
+        if report['errors'] > 0:
+            print('\nExiting! Please fix the label files listed in {}.'.format(
+                os.path.join(self.output_path, 'preflight_report.json')))
+            sys.exit(-1)
+
+    def calc_img_statistics(self):
+        approx = self.args.stats_img_approx
+        print("Calculating image statistics{} ...".format(" (approximation)" if approx else ""))
+
+        if approx:
+            seed = random.randint(1, 9999)
+            print('\tSeed:', seed)
+            rng = np.random.default_rng(seed)
+
+        # Rows of set, images, sampled images, mean, std, the confidence intervals of mean and std (approximation), the
+        # histogram (of the sample, None from a moment cache without histograms) and the moments (pixel count, sums and
+        # squares)
+        stats = []
+        strata = []
+        unreadable = []
+
+        moment_cache = None
+        if self.args.moment_cache is not None and not approx:
+            stem_ids = np.concatenate([self.index.sets[s] for s in self.image_sets])
+            moment_cache = self.moment_cache or MomentCache(self.args.moment_cache, self.image_path,
+                                                            self.args.stats_img_percentiles)
+            rows = moment_cache.update([self.index.image_file(stem_id) for stem_id in stem_ids.tolist()],
+                                       self.args.workers, self.args.io_order)
+            set_rows = np.split(rows, np.cumsum([len(self.index.sets[s]) for s in self.image_sets])[:-1])
+
+        for i, s in enumerate(self.image_sets):
             time.sleep(0.1)
             print("\tCalculating mean and variance for images in {} ...".format(s))
             time.sleep(0.1)
 
-            for i, image_filename in enumerate(tqdm(self.images[s], desc="\tProgress:", unit="files")):
-                image_path = os.path.join(self.image_path, image_filename)
-                image_arr = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+            if approx:
+                image_paths = [os.path.join(self.image_path, self.index.image_file(stem_id))
+                               for stem_id in self.index.sets[s].tolist()]
+                sample, histogram, set_unreadable = sample_moments(image_paths, self.args.workers,
+                                                                   self.args.stats_img_reduce,
+                                                                   self.args.stats_img_tolerance, rng)
+                strata.append((len(image_paths) - len(set_unreadable),) + sample)
+                stats.append([s, strata[-1][0], len(sample[0])] + list(estimate_mean_std(strata[-1:])) +
+                             [histogram, histogram_moments(histogram)])
+            else:
+                if moment_cache is not None:
+                    *moments, unreadable_rows = moment_cache.moments(set_rows[i])
+                    set_unreadable = [moment_cache.files[row] for row in unreadable_rows.tolist()]
+                    histogram = None if moment_cache.histograms is None else moment_cache.histogram(set_rows[i])
+                else:
+                    # Images decoded while converting are not decoded again
+                    histogram = self.set_histograms.get(s, empty_histogram()).copy()
+
+                    stem_ids = self.index.sets[s]
+                    if self.counted_images is not None:
+                        stem_ids = stem_ids[~self.counted_images[stem_ids]]
+                    remaining = [os.path.join(self.image_path, self.index.image_file(stem_id))
+                                 for stem_id in stem_ids.tolist()]
+
+                    # Read the images in disk order with readahead, the statistics do not depend on the order
+                    remaining = [remaining[j] for j in disk_order(remaining, self.args.io_order).tolist()]
+
+                    remaining_histogram, set_unreadable = calc_histogram(remaining, self.args.workers,
+                                                                         self.args.io_order != 'logical')
+                    histogram += remaining_histogram
+                    moments = histogram_moments(histogram)
 
-                mean_per_image.append(np.mean(image_arr, axis=(0, 1)))
-                self.img_var.append((np.var(image_arr, axis=(0, 1))))
+                num_images = len(self.index.sets[s]) - len(set_unreadable)
+                stats.append([s, num_images, num_images] + list(moments_mean_std(*moments)) +
+                             [None, None, histogram, moments])
 
-        self.img_mean = np.mean(mean_per_image, axis=0)
-        self.img_std = np.sqrt(np.divide(np.sum(self.img_var, axis=0), i))
+            unreadable += set_unreadable
+
+        histogram = None if any(stat[7] is None for stat in stats) else sum(stat[7] for stat in stats)
+        moments = [sum(stat[8][j] for stat in stats) for j in range(3)]
+        if approx:
+            full = list(estimate_mean_std(strata)) + [histogram, moments]
+        else:
+            full = list(moments_mean_std(*moments)) + [None, None, histogram, moments]
+
+        self.img_mean, self.img_std = full[:2]
+        if len(stats) != 1:
+            stats.append(['full', sum(stat[1] for stat in stats), sum(stat[2] for stat in stats)] + full)
+
+        if len(unreadable) > 0:
+            print("\tSkipped {} images which could not be read, e.g. {}".format(len(unreadable), unreadable[0]))
+
+        headers = ['Set', 'Images'] + (['Sampled'] if approx else []) + \
+                  ['Mean R', 'Mean G', 'Mean B', 'Std R', 'Std G', 'Std B'] + \
+                  (['\u00b1 Mean', '\u00b1 Std'] if approx else [])
+        table = []
+        for s, num_images, sampled, mean, std, mean_ci, std_ci, _, _ in stats:
+            table.append([s, num_images] + ([sampled] if approx else []) + list(mean) + list(std) +
+                         ([np.max(mean_ci), np.max(std_ci)] if approx else []))
+
+        time.sleep(0.1)
+        print(tabulate(table, headers=headers, tablefmt=self.args.tablefmt, floatfmt='.4f'))
         print("Mean (RGB) = {}, {}, {}\nStandard deviation = {}, {}, {}".format(self.img_mean[0], self.img_mean[1],
                                                                                 self.img_mean[2], self.img_std[0],
                                                                                 self.img_std[1], self.img_std[2]))
+        if approx:
+            print("Estimated from {} sampled images decoded at 1/{} resolution, 95 % confidence intervals \u00b1 "
+                  "{:.4f} (mean) and \u00b1 {:.4f} (std)".format(stats[-1][2], self.args.stats_img_reduce,
+                                                                 np.max(stats[-1][5]), np.max(stats[-1][6])))
+
+        # The full dataset first, then the sets
+        sections = stats[-1:] + stats[:-1] if len(stats) != 1 else stats
+        json_stats = {'approximation': approx, 'channels': ['R', 'G', 'B'], 'sets': {}}
+        if approx:
+            json_stats.update({'seed': seed, 'reduce': self.args.stats_img_reduce})
 
         create_dir(self.output_path)
         with open(os.path.join(self.output_path, "image_stats.txt"), 'w') as file:
-            file.write("Image statistics per RGB Channel")
-            file.write("mean = [{}, {}, {}]\n".format(self.img_mean[0], self.img_mean[1], self.img_mean[2]))
-            file.write("std = [{}, {}, {}]\n".format(self.img_std[0], self.img_std[1], self.img_std[2]))
+            file.write("Image statistics per RGB Channel\n")
+
+            for i, (s, num_images, sampled, mean, std, mean_ci, std_ci, histogram, moments) in enumerate(sections):
+                # Percentiles and clipping of the approximation are the ones of the sampled images, a moment cache
+                # without histograms has neither
+                set_stats = histogram_stats(histogram) if histogram is not None else {'pixels': int(moments[0])}
+                set_stats.update({'images': num_images, 'sampled': sampled, 'mean': list(mean), 'std': list(std)})
+
+                if i > 0:
+                    file.write("\n{} ({} images)\n".format(s, num_images))
+                file.write("mean = [{}, {}, {}]\n".format(mean[0], mean[1], mean[2]))
+                file.write("std = [{}, {}, {}]\n".format(std[0], std[1], std[2]))
+
+                if approx:
+                    set_stats.update({'mean_ci95': list(mean_ci), 'std_ci95': list(std_ci)})
+                    file.write("sampled = {}\n".format(sampled))
+                    file.write("mean_ci95 = [{}, {}, {}]\n".format(mean_ci[0], mean_ci[1], mean_ci[2]))
+                    file.write("std_ci95 = [{}, {}, {}]\n".format(std_ci[0], std_ci[1], std_ci[2]))
+
+                if histogram is not None:
+                    for p in ['1', '50', '99']:
+                        file.write("p{} = {}\n".format(p, set_stats['percentiles'][p]))
+                    file.write("clipped = {} (0), {} (255)\n".format(set_stats['clipped_low'],
+                                                                     set_stats['clipped_high']))
+
+                if s == 'full' or len(stats) == 1:
+                    json_stats['full'] = set_stats
+                if s != 'full':
+                    json_stats['sets'][s] = set_stats
+
+        with open(os.path.join(self.output_path, "image_stats.json"), 'w') as file:
+            json.dump(json_stats, file, indent=4)
 
     def calc_label_statistics(self, max_classes=206):
         time.sleep(0.1)
-        print("\n\nCreating dummy csv dataset ...")
-
-        converter = converters.CSVConverter(self.args)
-        converter.images = self.images
-        converter.label = self.label
-        converter.id2cat = self.id2cat
-        converter.excluded_classes = self.excluded_classes
-        converter.included_ids = self.included_ids
-        converter.label_id_mapping = self.label_id_mapping
-        converter.label_rearrange_mapping = self.label_rearrange_mapping
-
-        print("Calculating label statistics ...")
+        print("\n\nCalculating label statistics ...")
         dataframes = []
 
         for i, s in enumerate(self.image_sets):
@@ -460,7 +764,7 @@ class BaseConverter:
             print("\tCalculating for images in {} ...".format(s))
             time.sleep(0.1)
 
-            dataframes.append(converter.get_dataframe(s))
+            dataframes.append(self._get_dataframe(self._get_rows(s)))
             print_label_stats(self.output_path, self.id2cat, max_classes, self.excluded_classes, dataframes[i], s,
                               tablefmt=self.args.tablefmt)
 
@@ -469,6 +773,148 @@ class BaseConverter:
             print_label_stats(self.output_path, self.id2cat, max_classes, self.excluded_classes, df, set_title='full',
                               tablefmt=self.args.tablefmt)
 
+    def _label_file_path(self, stem_id):
+        return os.path.join(self.label_path, self.index.label_file(stem_id))
+
+    def _get_rows(self, image_set):
+        """ Returns the annotation store rows of the label files in a set, which are the stem ids of the set.
+        """
+        return self.index.sets[image_set]
+
+    def _map_class_id(self, class_id):
+        """ Maps a label map id to the final class id. Returns None when the object is dropped.
+        """
+        if class_id in self.label_id_mapping:
+            class_id = self.label_id_mapping[class_id]
+
+        if self.args.rearrange_ids:
+            if class_id in self.label_rearrange_mapping:
+                class_id = self.label_rearrange_mapping[class_id]
+            else:
+                return None
+
+        if class_id in self.excluded_classes:
+            return None
+
+        return class_id
+
+    def _compile_class_id_table(self):
+        """ Compiles the id mapping, rearranging and the in- and excluded classes into one lookup table.
+
+        The table maps every label map id to the final class id, DROPPED_CLASS_ID or UNKNOWN_CLASS_ID.
+        """
+        known_ids = [cat['id'] for cat in self.org_categories] + list(self.label_id_mapping) + \
+                    list(self.label_rearrange_mapping) + list(self.excluded_classes) + list(self.included_ids)
+        size = max(known_ids + [int(self.annotations.class_id.max()) if self.annotations.num_boxes > 0 else 0]) + 1
+
+        included_ids = set(self.included_ids)
+        self.class_id_table = np.full(size, UNKNOWN_CLASS_ID, dtype=np.int64)
+
+        for label_id in range(size):
+            class_id = self._map_class_id(label_id)
+
+            if class_id is None:
+                self.class_id_table[label_id] = DROPPED_CLASS_ID
+            elif class_id in included_ids:
+                self.class_id_table[label_id] = class_id
+
+    def _get_boxes(self, rows):
+        """ Returns the remaining objects of the given rows after mapping and filtering the class ids.
+        :param rows: Annotation store rows
+        :return: Dict of arrays, 'image' holds the position of the object's row in rows
+        """
+        indices, positions = self.annotations.box_indices(rows)
+
+        label_ids = self.annotations.class_id[indices]
+        class_ids = self.class_id_table[label_ids]
+
+        unknown = np.flatnonzero(class_ids == UNKNOWN_CLASS_ID)
+        if len(unknown) > 0:
+            print('\nError: Class ID {} not in label map or not included. Found in label file: {}'.format(
+                str(self._map_class_id(int(label_ids[unknown[0]]))),
+                self._label_file_path(rows[positions[unknown[0]]])))
+            sys.exit(-1)
+
+        keep = class_ids != DROPPED_CLASS_ID
+
+        xmin = self.annotations.xmin[indices]
+        ymin = self.annotations.ymin[indices]
+        xmax = self.annotations.xmax[indices]
+        ymax = self.annotations.ymax[indices]
+
+        if self.args.exclude_area is not None:
+            area = (xmax - xmin) * (ymax - ymin)
+            keep &= area > self.args.exclude_area
+
+        return {'image': positions[keep], 'class': class_ids[keep],
+                'xmin': xmin[keep], 'ymin': ymin[keep], 'xmax': xmax[keep], 'ymax': ymax[keep]}
+
+    def _resize_annotations(self):
+        """ Maps image sizes and boxes of all label files to the resized images, so every target format writes the
+        resized coordinates and --exclude-area applies to the resized boxes.
+        """
+        self.resize_geometry = resize_geometry(self.annotations.width, self.annotations.height, self.resize_settings)
+        self.annotations = self.annotations.resized(self.resize_geometry)
+
+    def _skip_images_without_label(self):
+        """ Removes all images without objects after mapping and filtering the class ids from all sets, before the
+        sets are split and any image is copied.
+        """
+        rows = np.arange(len(self.index), dtype=np.int64)
+        num_boxes = np.bincount(self._get_boxes(rows)['image'], minlength=len(rows))
+
+        without_label = num_boxes == 0
+        for image_set, stem_ids in self.index.sets.items():
+            self.index.sets[image_set] = stem_ids[~without_label[stem_ids]]
+
+        skipped_file = os.path.join(self.output_path, 'images_without_label.txt')
+        with open(skipped_file, 'w') as file:
+            for stem_id in np.flatnonzero(without_label).tolist():
+                file.write(self.index.image_file(stem_id) + '\n')
+
+        print('\nSkipping {} of {} images without label, written to {}'.format(int(without_label.sum()), len(rows),
+                                                                              skipped_file))
+
+    def _get_dataframe(self, rows, filenames='label'):
+        """ Returns the remaining objects of the given rows as data frame in csv format.
+        :param filenames: 'label' uses the filenames of the label files, 'output' the image paths inside the output set
+                          dir and 'image' the image paths relative to the image dir
+        """
+        boxes = self._get_boxes(rows)
+        box_rows = rows[boxes['image']]
+
+        if filenames == 'output':
+            filenames = [self.index.output_file(row) for row in box_rows]
+        elif filenames == 'image':
+            filenames = [self.index.image_file(row) for row in box_rows]
+        else:
+            filenames = [self.annotations.filenames[row] for row in box_rows]
+
+        return pd.DataFrame({'filename': filenames,
+                             'width': self.annotations.width[box_rows],
+                             'height': self.annotations.height[box_rows],
+                             'class': boxes['class'],
+                             'xmin': boxes['xmin'],
+                             'ymin': boxes['ymin'],
+                             'xmax': boxes['xmax'],
+                             'ymax': boxes['ymax']},
+                            columns=['filename', 'width', 'height', 'class', 'xmin', 'ymin', 'xmax', 'ymax'])
+
+    def _collect_not_verified(self, rows):
+        for row in rows[~self.annotations.verified[rows]]:
+            self.not_verified_label_files.append(self._label_file_path(row))
+
+    def _count_gt_boxes(self):
+        for class_id in self.gt_boxes:
+            self.gt_boxes[class_id]['num_gt_boxes'] = {}
+
+        for image_set in self.image_sets:
+            class_ids, counts = np.unique(self._get_boxes(self._get_rows(image_set))['class'], return_counts=True)
+
+            for class_id, num in zip(class_ids.tolist(), counts.tolist()):
+                if class_id in self.gt_boxes:
+                    self.gt_boxes[class_id]['num_gt_boxes'][image_set] = num
+
     def split(self, sets, set_sizes, shuffle):
         if self.images_split:
             return
@@ -476,7 +922,7 @@ class BaseConverter:
         print('\nSplitting data...')
 
         sets = [s + str(self.info['year']) for s in sets]
-        num_images = len(self.images['images'])
+        num_images = len(self.index.sets['images'])
         images_per_set = [int(num_images * size / sum(set_sizes)) for size in set_sizes]
 
         # Add remainder to first set
@@ -496,28 +942,16 @@ class BaseConverter:
             print('\tCreating {} with {} images...'.format(s, images_per_set))
             time.sleep(0.1)
 
-            # Make set output dir
-            set_dir = os.path.join(self.output_path, s)
-            if not os.path.exists(set_dir):
-                os.makedirs(set_dir)
-            else:
-                # Check if images already split and copied
-                if len(os.listdir(set_dir)) == images_per_set:
-                    self.images_copied = True
-
+            # Take images from the end of the remaining ones, last image first
+            remaining = self.index.sets['images']
+            self.index.sets[s] = remaining[len(remaining) - images_per_set:][::-1].copy()
+            self.index.sets['images'] = remaining[:len(remaining) - images_per_set]
             self.image_sets.append(s)
-            self.images[s] = []
-            self.label[s] = []
-
-            for i in tqdm(range(images_per_set), unit='file(s)', desc='\tProgress:'):
-                self.images[s].append(self.images['images'].pop())
-                self.label[s].append(self.label['images'].pop())
 
-                if not self.images_copied:
-                    self._save_image(i, s)
+            if not self.images_copied:
+                self._submit_images(s, range(images_per_set))
 
-        self.images.pop('images')
-        self.label.pop('images')
+        self.index.sets.pop('images')
         self.image_sets.remove('images')
 
         if self.file_lists is None:
@@ -525,64 +959,239 @@ class BaseConverter:
 
         self.images_copied = True
         self.images_split = True
-        self.image_src_filetype = self.image_dest_filetype
 
     def _shuffle(self):
-        zipped = list(zip(self.images['images'], self.label['images']))
+        stem_ids = self.index.sets['images'].tolist()
 
         seed = random.randint(1, 9999)
         print('Seed:', seed)
         random.seed(seed)
 
-        random.shuffle(zipped)
+        random.shuffle(stem_ids)
 
-        images, label = zip(*zipped)
-        self.images['images'], self.label['images'] = list(images), list(label)
+        self.index.sets['images'] = np.array(stem_ids, dtype=np.int64)
 
     def _write_file_list(self):
         for s in self.image_sets:
             with open(os.path.join(self.output_path, s + '_file_list.txt'), 'w')as file:
                 file.write("Set={}\n".format(s))
 
-                for filename in self.images[s]:
-                    file.write(os.path.splitext(filename)[0] + '\n')
+                for stem_id in self.index.sets[s]:
+                    file.write(self.index.stems[stem_id] + '\n')
 
     def _copy_all_images(self):
-        time.sleep(0.1)
-        print("\nCopying all images ...")
-
+        """ Queues all images of all sets, they are written in the background while the labels are converted.
+        """
         for s in self.image_sets:
+            self._submit_images(s, range(len(self.index.sets[s])))
+
+        self.images_copied = True
+
+    def _submit_images(self, image_set, positions):
+        """ Queues the images of a set which are missing or changed according to the manifest of the set dir and
+        removes stale images. Copies run on the I/O thread pool and transcodes (see util.image_pipeline) on a process
+        pool.
+        _wait_for_images has to be called before the images are used.
+        :param image_set: Name of the set, the images are written to the set dir
+        :param positions: Positions of the images in the set
+        """
+        output_path = create_dir(os.path.join(self.output_path, image_set))
+        transcode = self.index.image_ext != self.index.output_ext or self.resize_settings is not None
+
+        planned = {}
+        for stem_id in self.index.sets[image_set][positions].tolist():
+            image_path = os.path.join(self.image_path, self.index.image_file(stem_id))
+
+            entry = self.image_entries.get(self.index.stems[stem_id])
+            if entry is None:
+                assert os.path.isfile(image_path), "File not found: {}".format(image_path)
+                stat = os.stat(image_path)
+            else:
+                stat = entry.stat()
+
+            entry = [os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns]
+            if self.args.image_store is not None:
+                content_hash = self.image_catalog.hash[self.image_catalog_rows[stem_id]]
+                entry.append(object_key(content_hash, self._store_settings(stem_id)))
+
+            planned[self.index.output_file(stem_id)] = (stem_id, entry)
+
+        if image_set not in self.manifests:
+            self.manifests[image_set] = {'dir': output_path, 'images': {},
+                                         'old': load_manifest(output_path, self._manifest_settings())}
+        manifest = self.manifests[image_set]
+
+        changed, stale = diff_manifest(manifest['old'], {image: entry for image, (_, entry) in planned.items()},
+                                       list_files(output_path))
+
+        for image in stale:
+            os.remove(os.path.join(output_path, image))
+        remove_empty_fan_out_dirs(output_path, stale)
+
+        changed = set(changed)
+        manifest['images'].update((image, entry) for image, (_, entry) in planned.items() if image not in changed)
+
+        print('\t{}: {} images up to date, {} to write, {} stale images removed.'.format(
+            image_set, len(planned) - len(changed), len(changed), len(stale)))
+
+        if len(changed) == 0:
+            return
+
+        create_fan_out_dirs(output_path, changed)
+
+        if transcode and self.transcode_pool is None:
+            self.transcode_pool = ProcessPoolExecutor(max_workers=self.args.workers)
+        if not transcode and self.io_pool is None:
+            self.io_pool = ThreadPoolExecutor(max_workers=self.args.io_workers)
+
+        # Queue the images in disk order, every task hints the image one readahead window ahead
+        changed = sorted(changed)
+        order = disk_order([planned[image][1][0] for image in changed], self.args.io_order,
+                           [self.image_entries.get(self.index.stems[planned[image][0]]) for image in changed])
+        changed = [changed[i] for i in order.tolist()]
+
+        hints = [planned[image][1][0] for image in changed] if self.args.io_order != 'logical' else []
+        Readahead(hints).advance(0)
+
+        for i, image in enumerate(changed):
+            stem_id, entry = planned[image]
+            image_out_path = os.path.join(output_path, image)
+            hint = hints[i + READAHEAD_WINDOW] if i + READAHEAD_WINDOW < len(hints) else None
+
+            geometry = None if self.resize_geometry is None else image_geometry(self.resize_geometry, stem_id)
+
+            if self.args.image_store is not None:
+                future = (self.transcode_pool if transcode else self.io_pool).submit(
+                    with_readahead, hint, store_image, self.args.image_store, entry[3], entry[0], image_out_path,
+                    self.args.materialize, self.transcode_options if transcode else None, geometry,
+                    self.fuse_img_statistics)
+            elif transcode:
+                future = self.transcode_pool.submit(with_readahead, hint, process_image, entry[0], image_out_path,
+                                                    self.transcode_options, geometry, self.fuse_img_statistics)
+            else:
+                future = self.io_pool.submit(with_readahead, hint, materialize_file, entry[0], image_out_path,
+                                             self.args.materialize)
+
+            self.pending_images[future] = (image_set, stem_id, image, entry)
+
+    def _wait_for_images(self):
+        """ Waits until all queued images are written and saves the manifests of the set dirs, the first failed image
+        raises its error.
+        """
+        try:
+            if len(self.pending_images) == 0:
+                return
+
             time.sleep(0.1)
-            print("\tRunning copy operation for {} ...".format(s))
+            print("\nCopying {} images ...".format(len(self.pending_images)))
             time.sleep(0.1)
 
-            for idx in tqdm(range(len(self.images[s])), desc='\tProgress', unit='files'):
-                self._save_image(idx, s)
+            for future in tqdm(as_completed(self.pending_images), total=len(self.pending_images),
+                               desc='\tProgress', unit='files'):
+                result = future.result()
+                image_set, stem_id, image, entry = self.pending_images[future]
 
-        self.images_copied = True
+                self.manifests[image_set]['images'][image] = entry
 
-    def _save_image(self, idx, image_set):
-        image_path = os.path.join(self.image_path, self.images[image_set][idx])
-        assert os.path.isfile(image_path), "File not found: {}".format(image_path)
+                if self.transcode_pool is not None:
+                    self.transcoded_images.append((image_set, stem_id) + result[:2])
 
-        output_path = create_dir(os.path.join(self.output_path, image_set))
+                    if result[2] is not None:
+                        self._add_image_histogram(image_set, stem_id, entry, result[2])
+        finally:
+            for pool in [self.io_pool, self.transcode_pool]:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+
+            self.io_pool = None
+            self.transcode_pool = None
+            self.pending_images = {}
+
+            # Images written so far are kept on errors, so a re-run continues where this one stopped
+            for manifest in self.manifests.values():
+                save_manifest(manifest['dir'], self._manifest_settings(), manifest['images'])
+
+                if self.args.image_store is not None:
+                    write_refs(self.args.image_store, manifest['dir'],
+                               [entry[3] for entry in manifest['images'].values()])
+            self.manifests = {}
+
+            if self.moment_cache is not None:
+                self.moment_cache.save()
 
-        if not self.image_src_filetype == self.image_dest_filetype:
-            image = Image.open(image_path).convert('RGB')
-            self.images[image_set][idx] = os.path.basename(image_path).replace('.' + self.image_src_filetype,
-                                                                               '.' + self.image_dest_filetype)
+        if len(self.transcoded_images) > 0:
+            self._print_transcode_savings()
 
-            image_out_path = os.path.join(output_path, self.images[image_set][idx])
-            image.save(image_out_path)
+    def _add_image_histogram(self, image_set, stem_id, entry, histogram):
+        """ Adds the histogram of an image decoded while converting to the histogram of its set, or with --moment-cache
+        to the cache, so calc_img_statistics does not decode the image again.
+        """
+        if self.moment_cache is not None:
+            self.moment_cache.add(self.index.image_file(stem_id), (entry[1], entry[2]), histogram)
+            return
+
+        if self.counted_images is None:
+            self.counted_images = np.zeros(len(self.index), dtype=bool)
+
+        set_histogram = self.set_histograms.setdefault(image_set, empty_histogram())
+        set_histogram += histogram
+        self.counted_images[stem_id] = True
+
+    def _manifest_settings(self):
+        """ Returns all settings which change the written images, images written with other settings are rewritten.
+        """
+        settings = {'filetype': self.index.output_ext, 'fan_out': self.index.fan_out,
+                    'image_store': self.args.image_store, 'resize': self.resize_settings}
+
+        if self.index.image_ext != self.index.output_ext or self.resize_settings is not None:
+            settings['transcode'] = self.transcode_options
         else:
-            image_out_path = os.path.join(output_path, os.path.basename(image_path))
+            settings['materialize'] = self.args.materialize
+
+        return settings
+
+    def _store_settings(self, stem_id):
+        """ Returns all settings which change the content of a stored image.
+        """
+        settings = {'filetype': self.index.output_ext}
+
+        if self.index.image_ext != self.index.output_ext or self.resize_settings is not None:
+            settings['transcode'] = self.transcode_options
 
-            if not os.path.isfile(image_out_path):
-                shutil.copyfile(image_path, image_out_path)
+        if self.resize_geometry is not None:
+            settings['resize'] = image_geometry(self.resize_geometry, stem_id)
+
+        return settings
+
+    def _print_transcode_savings(self):
+        """ Writes the byte savings of every transcoded image to 'transcoded_images.csv' and prints them per set.
+        """
+        df = pd.DataFrame(self.transcoded_images, columns=['set', 'stem_id', 'source_bytes', 'output_bytes'])
+        df['image'] = [self.index.output_file(stem_id) for stem_id in df['stem_id']]
+        df['saved_bytes'] = df['source_bytes'] - df['output_bytes']
+        df = df.sort_values(['set', 'image'])
+
+        df[['set', 'image', 'source_bytes', 'output_bytes', 'saved_bytes']].to_csv(
+            os.path.join(self.output_path, 'transcoded_images.csv'), index=None)
+
+        summary = [{'Set': image_set,
+                    'Images': len(group),
+                    'Source [MB]': group['source_bytes'].sum() / 1e6,
+                    'Output [MB]': group['output_bytes'].sum() / 1e6,
+                    'Saved [%]': group['saved_bytes'].sum() / max(1, group['source_bytes'].sum()) * 100}
+                   for image_set, group in df.groupby('set', sort=False)]
+
+        print('\nTranscoded {}images to {} (all images written to transcoded_images.csv):'.format(
+            'and resized ' if self.resize_settings is not None else '', self.index.output_ext))
+        print(tabulate(summary, headers='keys', tablefmt=self.args.tablefmt, showindex=False, floatfmt='.2f'))
+
+        self.transcoded_images = []
 
     def print_class_distribution(self):
         print('\nPrinting class distribution for image sets...')
 
+        self._count_gt_boxes()
+
         data = dict()
         data['class id'] = [class_id for class_id in sorted(self.gt_boxes)]
         data['class'] = [self.gt_boxes[class_id]['name'] for class_id in sorted(self.gt_boxes)]
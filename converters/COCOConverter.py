@@ -1,8 +1,6 @@
 import json
 import os
-import sys
 import time
-import xml.etree.ElementTree as ET
 
 import numpy as np
 from pycocotools import coco as cocoapi
@@ -71,6 +69,8 @@ class COCOConverter(converters.BaseConverter):
             annotation_file = os.path.join(self.output_path, "annotations", "instances_" + image_set + ".json")
             self._test_dataset(annotation_file)
 
+        self._wait_for_images()
+
         if self.args.show_not_verified:
             warning_not_verified_label_files(self.not_verified_label_files)
 
@@ -91,98 +91,41 @@ class COCOConverter(converters.BaseConverter):
         images = []
         annotations = []
 
-        for image_id, image_filename in enumerate(tqdm(self.images[image_set], desc='\tProgress', unit='files')):
-            label_path = os.path.join(self.label_path, image_filename.replace('.' + self.image_src_filetype, '.xml'))
-            assert os.path.isfile(label_path), "File not found: {}".format(label_path)
-
-            annotation_list, im_width, im_height = self._get_annotations(image_set=image_set, image_id=image_id,
-                                                                         label_path=label_path)
-            for annotation in annotation_list:
-                annotations.append(annotation)
-
-            if not self.images_copied:
-                if self.skip_images_without_label:
-                    if len(annotation_list) > 0:
-                        self._save_image(image_id, image_set)
-                else:
-                    self._save_image(image_id, image_set)
-
-            images.append({
-                "license": 1,
-                "file_name": image_filename,
-                "height": im_height,
-                "width": im_width,
-                "id": image_id + 1
-            })
-
-        return images, annotations
-
-    def _get_annotations(self, image_set, image_id, label_path):
-        xml_tree = ET.parse(label_path).getroot()
-
-        if "verified" not in xml_tree.attrib:
-            self.not_verified_label_files.append(label_path)
+        rows = self._get_rows(image_set)
+        self._collect_not_verified(rows)
 
-        annotation_list = []
-        width = int(xml_tree.find('size')[0].text)
-        height = int(xml_tree.find('size')[1].text)
+        boxes = self._get_boxes(rows)
 
-        for member in xml_tree.findall('object'):
-            if not str(member[0].text).isdigit():
-                print(
-                    '\nError: Class ID \'{}\' not convertible to integer. Found in label file: {}'.format(
-                        member[0].text, label_path))
-                sys.exit(-1)
+        bbox_w = boxes['xmax'] - boxes['xmin']
+        bbox_h = boxes['ymax'] - boxes['ymin']
 
-            category_id = int(member[0].text) + 1
+        annotation_ids = np.arange(self.annotation_id, self.annotation_id + len(boxes['class']))
+        self.annotation_id += len(boxes['class'])
 
-            if category_id in self.label_id_mapping:
-                category_id = self.label_id_mapping[category_id]
-
-            if self.args.rearrange_ids:
-                if category_id in self.label_rearrange_mapping:
-                    category_id = self.label_rearrange_mapping[category_id]
-                else:
-                    continue
-
-            if category_id in self.excluded_classes:
-                continue
-
-            if category_id not in self.included_ids:
-                print(
-                    '\nError: Class ID {} not in label map or not included. Found in label file: {}'.format(
-                        str(category_id), label_path))
-                sys.exit(-1)
-
-            xmin = int(member[4][0].text)
-            ymin = int(member[4][1].text)
-            xmax = int(member[4][2].text)
-            ymax = int(member[4][3].text)
-
-            bbox = [xmin, ymax, xmax - xmin, ymax - ymin]
-            area = np.float(bbox[2] * bbox[3])
-
-            if self.args.exclude_area is not None:
-                if area <= self.args.exclude_area:
-                    continue
-
-            annotation_list.append({
+        for xmin, ymax, w, h, category_id, image_id, annotation_id in zip(
+                boxes['xmin'].tolist(), boxes['ymax'].tolist(), bbox_w.tolist(), bbox_h.tolist(),
+                boxes['class'].tolist(), boxes['image'].tolist(), annotation_ids.tolist()):
+            annotations.append({
                 # https://github.com/facebookresearch/Detectron/issues/48#issuecomment-361028870
                 "segmentation": [],
-                "area": area,
+                "area": float(w * h),
                 "iscrowd": 0,
                 "image_id": image_id + 1,
-                "bbox": bbox,
+                "bbox": [xmin, ymax, w, h],
                 "category_id": category_id,
-                "id": self.annotation_id
+                "id": annotation_id
             })
 
-            if category_id in self.gt_boxes:
-                if image_set in self.gt_boxes[category_id]['num_gt_boxes']:
-                    self.gt_boxes[category_id]['num_gt_boxes'][image_set] += 1
-                else:
-                    self.gt_boxes[category_id]['num_gt_boxes'][image_set] = 1
+        if not self.images_copied:
+            self._submit_images(image_set, np.arange(len(rows)))
 
-            self.annotation_id += 1
+        for image_id, stem_id in enumerate(tqdm(rows, desc='\tProgress', unit='files')):
+            images.append({
+                "license": 1,
+                "file_name": self.index.output_file(stem_id),
+                "height": int(self.annotations.height[stem_id]),
+                "width": int(self.annotations.width[stem_id]),
+                "id": image_id + 1
+            })
 
-        return annotation_list, width, height
+        return images, annotations
@@ -1,13 +1,13 @@
 import os
-import sys
 import time
-import xml.etree.ElementTree as ET
 
 import numpy as np
+import pandas as pd
+from tabulate import tabulate
 from tqdm import tqdm
 
 from converters.BaseConverter import BaseConverter
-from util.util import create_dir, warning_not_verified_label_files
+from util.util import create_dir, create_fan_out_dirs, warning_not_verified_label_files
 
 
 class DarknetConverter(BaseConverter):
@@ -17,12 +17,15 @@ class DarknetConverter(BaseConverter):
 
         self.rel_output_path = args.rel_output_path
         self.dataset_name = args.dataset_name
-        self.skipped_labels = []
+        self.skipped_labels = pd.DataFrame(columns=['class_id', 'var', 'value', 'label_file'])
 
     def convert(self):
         time.sleep(0.1)
         print("\nCreating darknet dataset...")
 
+        if not self.images_copied:
+            self._copy_all_images()
+
         for image_set in self.image_sets:
             time.sleep(0.1)
             print("\n\tCreating {} set...".format(image_set))
@@ -36,18 +39,12 @@ class DarknetConverter(BaseConverter):
                 for line in set_file_list:
                     file.write("{}\n".format(line))
 
-            print("\t\tSkipped {} bboxes.".format(len(self.skipped_labels)))
-            for class_id, var, value, xml_file in self.skipped_labels:
-                print("\t\tSkipped class with id {class_id}, because {var} was {value} in label file: {xml_file}".format(
-                    class_id=class_id, var=var, value=value, xml_file=xml_file))
-
-            self.skipped_labels = []
+            self._print_skipped_labels(image_set)
 
         print("\nWriting config files ...")
         self._create_cfg_files()
 
-        if not self.images_copied:
-            self._copy_all_images()
+        self._wait_for_images()
 
         if self.args.show_not_verified:
             warning_not_verified_label_files(self.not_verified_label_files)
@@ -56,101 +53,74 @@ class DarknetConverter(BaseConverter):
         label_target_folder = create_dir(os.path.join(self.output_path, image_set))
         set_file_list = []
 
-        for xml_filename in tqdm(self.label[image_set], unit="files", desc='\t\tProgress:'):
-            xml_file = os.path.join(self.label_path, xml_filename)
+        rows = self._get_rows(image_set)
+        self._collect_not_verified(rows)
+
+        boxes = self._get_boxes(rows)
+
+        width = self.annotations.width[rows[boxes['image']]]
+        height = self.annotations.height[rows[boxes['image']]]
+
+        # Convert to center values
+        x_center = boxes['xmax'] - (boxes['xmax'] - boxes['xmin']) / 2
+        y_center = boxes['ymax'] - (boxes['ymax'] - boxes['ymin']) / 2
+        bbox_w = boxes['xmax'] - boxes['xmin']
+        bbox_h = boxes['ymax'] - boxes['ymin']
+
+        # Convert to relative values
+        values = {'x': x_center / width, 'y': y_center / height, 'w': bbox_w / width, 'h': bbox_h / height}
 
-            xml_tree = ET.parse(xml_file).getroot()
+        # Check boundaries, a skipped box is reported for the first value out of bounds
+        valid = np.ones(len(boxes['class']), dtype=bool)
+        skipped = []
 
-            if "verified" not in xml_tree.attrib:
-                self.not_verified_label_files.append(xml_file)
+        for var, value in values.items():
+            out_of_bounds = valid & ~((0.0 < value) & (value <= 1.0))
+            valid &= ~out_of_bounds
 
-            label_file = os.path.join(label_target_folder, xml_filename.replace('.xml', '.txt'))
+            skipped.append(pd.DataFrame({
+                'class_id': boxes['class'][out_of_bounds],
+                'var': var,
+                'value': value[out_of_bounds],
+                'label_file': [self._label_file_path(row)
+                               for row in rows[boxes['image'][out_of_bounds]]]
+            }, columns=['class_id', 'var', 'value', 'label_file']))
+
+        self.skipped_labels = pd.concat(skipped, ignore_index=True)
+
+        lines = ['{} {:.6f} {:.6f} {:.6f} {:.6f}\n'.format(*line) for line in zip(
+            (boxes['class'][valid] - 1).tolist(), values['x'][valid].tolist(), values['y'][valid].tolist(),
+            values['w'][valid].tolist(), values['h'][valid].tolist())]
+        line_offsets = np.searchsorted(boxes['image'][valid], np.arange(len(rows) + 1)).tolist()
+
+        label_files = [self.index.output_file(stem_id, ext='txt') for stem_id in rows]
+        create_fan_out_dirs(label_target_folder, label_files)
+
+        for pos, stem_id in enumerate(tqdm(rows, unit="files", desc='\t\tProgress:')):
+            label_file = os.path.join(label_target_folder, label_files[pos])
             with open(label_file, 'w') as file:
+                file.write(''.join(lines[line_offsets[pos]:line_offsets[pos + 1]]))
 
-                # Get image width and height
-                width = int(xml_tree.find('size')[0].text)
-                height = int(xml_tree.find('size')[1].text)
-
-                for member in xml_tree.findall('object'):
-                    if not str(member[0].text).isdigit():
-                        print(
-                            '\nError: Class ID \'{}\' not convertible to integer. Found in label file: {}'.format(
-                                member[0].text, xml_file))
-                        sys.exit(-1)
-
-                    class_id = int(member[0].text) + 1
-
-                    if class_id in self.label_id_mapping:
-                        class_id = self.label_id_mapping[class_id]
-
-                    if self.args.rearrange_ids:
-                        if class_id in self.label_rearrange_mapping:
-                            class_id = self.label_rearrange_mapping[class_id]
-                        else:
-                            continue
-
-                    if class_id in self.excluded_classes:
-                        continue
-
-                    if class_id not in self.included_ids:
-                        print(
-                            'Error: Class ID {} not in label map or not included. Found in label file: {}'.format(
-                                str(class_id), xml_file))
-                        sys.exit(-1)
-
-                    x_min = int(member[4][0].text)
-                    y_min = int(member[4][1].text)
-                    x_max = int(member[4][2].text)
-                    y_max = int(member[4][3].text)
-
-                    area = np.float((x_max - x_min) * (y_max - y_min))
-
-                    if self.args.exclude_area is not None:
-                        if area <= self.args.exclude_area:
-                            continue
-
-                    if class_id in self.gt_boxes:
-                        if image_set in self.gt_boxes[class_id]['num_gt_boxes']:
-                            self.gt_boxes[class_id]['num_gt_boxes'][image_set] += 1
-                        else:
-                            self.gt_boxes[class_id]['num_gt_boxes'][image_set] = 1
-
-                    # Convert to center values
-                    x_center = x_max - (x_max - x_min) / 2
-                    y_center = y_max - (y_max - y_min) / 2
-                    bbox_w = x_max - x_min
-                    bbox_h = y_max - y_min
-
-                    # Convert to relative values
-                    x = x_center / width
-                    y = y_center / height
-                    w = bbox_w / width
-                    h = bbox_h / height
-
-                    # Check boundaries
-                    if not 0.0 < x <= 1.0:
-                        self.skipped_labels.append((class_id, "x", x, xml_file))
-                        continue
-                    if not 0.0 < y <= 1.0:
-                        self.skipped_labels.append((class_id, "y", y, xml_file))
-                        continue
-                    if not 0.0 < w <= 1.0:
-                        self.skipped_labels.append((class_id, "w", w, xml_file))
-                        continue
-                    if not 0.0 < h <= 1.0:
-                        self.skipped_labels.append((class_id, "h", h, xml_file))
-                        continue
-
-                    # Write to file
-                    file.write(
-                        '{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n'.format(class_id=class_id - 1, x=x, y=y, w=w, h=h))
-
-            # Add file to set list
-            filename = xml_tree.find('filename').text
-            set_file_list.append(os.path.join(self.rel_output_path, image_set, filename))
+            # Add image to set list
+            set_file_list.append(os.path.join(self.rel_output_path, image_set, self.index.output_file(stem_id)))
 
         return set_file_list
 
+    def _print_skipped_labels(self, image_set):
+        print("\t\tSkipped {} bboxes.".format(len(self.skipped_labels)))
+
+        if len(self.skipped_labels) == 0:
+            return
+
+        skipped_file = os.path.join(self.output_path, '{}_skipped_labels.csv'.format(image_set))
+        self.skipped_labels.to_csv(skipped_file, index=None)
+
+        summary = self.skipped_labels.groupby(['class_id', 'var'])['value'].agg(['count', 'min', 'max']).reset_index()
+        summary.insert(1, 'class', [self.id2cat.get(class_id, '') for class_id in summary['class_id']])
+
+        print(tabulate(summary, headers='keys', tablefmt=self.args.tablefmt, showindex=False, floatfmt=".3f"))
+        print("\t\tAll skipped bboxes written to {}".format(skipped_file))
+
     def _create_cfg_files(self):
         # .data file
         data_str = "classes = {class_num}\n" \
@@ -12,21 +12,35 @@ class TFRecordConverter(converters.BaseConverter):
 
         self.csv_converter = converters.CSVConverter(args)
 
+        # The records are created from the source images, or from the written images when they are resized. Images in
+        # sub dirs (--recursive) are found by their path relative to the image dir.
+        self.resized = args.resize is not None or args.max_side is not None
+        if self.resized:
+            self.csv_converter.filenames = 'output'
+        else:
+            self.csv_converter.filenames = 'image' if args.recursive else 'label'
+
     def convert(self):
+        if not self.images_copied:
+            self._copy_all_images()
+
         time.sleep(0.1)
         self._copy_values_to_csv_converter()
         self.csv_converter.convert()
         self._copy_values_from_csv_converter()
 
+        if self.resized:
+            self._wait_for_images()
+
         time.sleep(0.1)
         for image_set in self.image_sets:
             print('\nCreating tfrecord files for {} ...'.format(image_set))
-            converters.generate_tfrecord(self.image_path, self.output_path, image_set, self.id2cat)
+            image_path = os.path.join(self.output_path, image_set) if self.resized else self.image_path
+            converters.generate_tfrecord(image_path, self.output_path, image_set, self.id2cat)
 
         self._create_label_map_pbtxt()
 
-        if not self.images_copied:
-            self._copy_all_images()
+        self._wait_for_images()
 
         if self.args.show_not_verified:
             warning_not_verified_label_files(self.not_verified_label_files)
@@ -45,14 +59,16 @@ class TFRecordConverter(converters.BaseConverter):
 
         self.csv_converter.label_id_mapping = self.label_id_mapping
         self.csv_converter.label_rearrange_mapping = self.label_rearrange_mapping
+        self.csv_converter.class_id_table = self.class_id_table
 
         self.csv_converter.cat2id = self.cat2id
         self.csv_converter.id2cat = self.id2cat
         self.csv_converter.gt_boxes = self.gt_boxes
 
-        self.csv_converter.images = self.images
-        self.csv_converter.label = self.label
+        self.csv_converter.index = self.index
+        self.csv_converter.image_entries = self.image_entries
         self.csv_converter.image_sets = self.image_sets
+        self.csv_converter.annotations = self.annotations
 
     def _copy_values_from_csv_converter(self):
         self.images_copied = self.csv_converter.images_copied
@@ -71,8 +87,7 @@ class TFRecordConverter(converters.BaseConverter):
         self.id2cat = self.csv_converter.id2cat
         self.gt_boxes = self.csv_converter.gt_boxes
 
-        self.images = self.csv_converter.images
-        self.label = self.csv_converter.label
+        self.index = self.csv_converter.index
         self.image_sets = self.csv_converter.image_sets
 
     def _create_label_map_pbtxt(self):
@@ -1,5 +1,6 @@
 import os
 from types import SimpleNamespace
+import argparse
 import os
 import sys
 import time
@@ -10,6 +11,8 @@ import pandas as pd
 from tqdm import tqdm
 import cv2
 from util.util import *
+from util.image_catalog import probe_image
+from util.image_check import read_quarantine_list
 
 
 def get_subfolder_name(class_id, args):
@@ -49,19 +52,35 @@ def write_cuts_to_subfolder(objects, args):
 def cut_objects(objects, args):
     """ Cuts out the labeled object from the image.
     :param objects: Dict with filename, class_ids and coords
-    :return: Object as nd array
+    :return: False when the image could not be decoded
     """
 
     image_path = os.path.join(args.image_path, objects['filename'])
 
+    # Check the size from the image header before decoding, fall back to the decoded image for unknown formats
+    size = probe_image(image_path)
+    if size is not None:
+        assert size[1] == objects['height']
+        assert size[0] == objects['width']
+
     image = cv2.imread(image_path)
-    height, width, channels = image.shape
-    assert height == objects['height']
-    assert width == objects['width']
+
+    # A valid header does not mean the image data can be decoded
+    if image is None:
+        tqdm.write('Skipping {}, the image could not be decoded. Run convert.py --check-images to quarantine invalid '
+                   'images.'.format(image_path))
+        return False
+
+    if size is None:
+        height, width, channels = image.shape
+        assert height == objects['height']
+        assert width == objects['width']
 
     for xmin, ymin, xmax, ymax in objects['coords']:
         objects['cuts'].append(image[ymin:ymax, xmin:xmax, :])
 
+    return True
+
 
 def create_dataset(args):
     image_list = os.listdir(args.image_path)
@@ -73,6 +92,12 @@ def create_dataset(args):
     if args.target_format == 'subfolders':
         create_subfolders(args)
 
+    # Images which failed the image check of convert.py
+    quarantined = set()
+    if getattr(args, 'quarantine_list', None) is not None:
+        quarantined = read_quarantine_list(args.quarantine_list)
+        print('\nSkipping {} quarantined images of {}'.format(len(quarantined), args.quarantine_list))
+
     print('\nIterating label files and writing cutouts to disk...')
     time.sleep(0.5)
 
@@ -82,6 +107,9 @@ def create_dataset(args):
         xml_tree = ET.parse(label_file).getroot()
 
         filename = xml_tree.find('filename').text
+        if filename in quarantined:
+            continue
+
         width = int(xml_tree.find('size')[0].text)
         height = int(xml_tree.find('size')[1].text)
 
@@ -114,7 +142,8 @@ def create_dataset(args):
             objects['coords'].append((xmin, ymin, xmax, ymax))
 
         if len(objects['class_ids']) > 0:
-            cut_objects(objects, args)
+            if not cut_objects(objects, args):
+                continue
 
             if args.target_format == 'subfolders':
                 write_cuts_to_subfolder(objects, args)
@@ -172,7 +201,22 @@ roadsurface = [
 ]
 
 
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser = argparse.ArgumentParser(description='Cuts out the labeled objects of the included classes.')
+
+    parser.add_argument('--quarantine-list', help='Skips all images in the given quarantine list, e.g. the'
+                                                  ' \'quarantined_images.txt\' written by convert.py --check-images.'
+                                                  ' (default: None)',
+                        type=str, default=None)
+
+    return parser.parse_args(args)
+
+
 def main():
+    cli_args = parse_args(sys.argv[1:])
+
     args = SimpleNamespace()
 
     args.image_path = '/home/osm/Schreibtisch/01_Datasets/2019_Juli/01_Rawdata/Images/'
@@ -197,6 +241,9 @@ def main():
 
     args.min_size = 1024
 
+    # Quarantine list written by convert.py --check-images
+    args.quarantine_list = cli_args.quarantine_list
+
     categories = json.load(open(args.label_map, 'r')).get('classes')
     args.categories = [{'id': cat['id'], 'name': cat['name']} for cat in categories]
     args.cat2id = {cat['name']: cat['id'] for cat in args.categories}
@@ -18,7 +18,7 @@ from convert import main
 #                  show_not_verified=False, shuffle=True, skip_images_without_label=False, stats=False, stats_img=False,
 #                  stats_label=False, tablefmt='psql', target_format='csv', year=2019)
 
-args = Namespace(dataset_name=None,
+args = Namespace(clear_label_cache=False, dataset_name=None,
                  exclude=[1, 7, 30, 31, 42, 43, 44, 46, 47, 48, 49, 50, 51, 52, 57, 63, 64, 65, 67, 68, 69, 71, 72, 73,
                           76, 77, 78, 79, 80, 82, 83, 84, 86, 88, 94, 95, 97, 98, 99, 100, 101, 102, 103, 104, 105, 106,
                           107, 108, 113, 114, 115, 117, 120, 121, 131, 136, 137, 138, 139, 140, 141, 142, 143, 144, 146,
@@ -27,7 +27,7 @@ args = Namespace(dataset_name=None,
                           164, 168, 172, 165, 169, 173, 179, 182, 189, 198, 200], exclude_area=256,
                  exclude_starts_at_one=True, file_list_path=None, file_lists=None, image_dest_filetype='png',
                  image_path='/home/osm/Schreibtisch/01_Datasets/2019_Juli/01_Rawdata/Images/', image_src_filetype='png',
-                 include=None, include_starts_at_one=False, label_map='./label_map.json',
+                 include=None, include_starts_at_one=False, label_cache='', label_map='./label_map.json',
                  label_path='/home/osm/Schreibtisch/01_Datasets/2019_Juli/01_Rawdata/Labels/',
                  mapping={'type': 'combine_by_id', 'ids_from_org_list': False,
                           'new_labels': [{'new_name': 'pedestrian crossing (danger)', 'new_id': 28, 'old_id': [28, 29]},
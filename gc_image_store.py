@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+
+from util.image_store import collect_garbage
+from util.manifest import MANIFEST_FILE
+
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser = argparse.ArgumentParser(description='Removes all images of an image store (see convert.py'
+                                                 ' --image-store) which are not used by any output dir anymore.')
+
+    parser.add_argument('--image-store', help='Path to the image store.',
+                        type=str, required=True)
+    parser.add_argument('--dry-run', help='Only reports what would be removed when set.',
+                        action='store_const', const=True, default=False)
+
+    return parser.parse_args(args)
+
+
+def is_alive(set_dir):
+    """ References of a set dir are kept as long as its image manifest exists.
+    """
+    return os.path.isfile(os.path.join(set_dir, MANIFEST_FILE))
+
+
+def main(args=None):
+    if args is None:
+        args = parse_args(sys.argv[1:])
+
+    assert os.path.isdir(args.image_store), 'Image store not found at: {}'.format(args.image_store)
+
+    removed_refs, removed_objects, freed_bytes = collect_garbage(args.image_store, is_alive, args.dry_run)
+
+    print('{} {} references of deleted output dirs and {} unused images ({:.1f} MB).'.format(
+        'Would remove' if args.dry_run else 'Removed', removed_refs, removed_objects, freed_bytes / 1e6))
+
+
+if __name__ == '__main__':
+    main()
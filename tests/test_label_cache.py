@@ -0,0 +1,55 @@
+from util.label_cache import LabelCache
+
+LABEL_FILE = b'''<annotation>
+\t<filename>im007.png</filename>
+\t<size>
+\t\t<width>640</width>
+\t\t<height>480</height>
+\t\t<depth>3</depth>
+\t</size>
+\t<object>
+\t\t<name>0</name>
+\t\t<pose>Unspecified</pose>
+\t\t<truncated>0</truncated>
+\t\t<difficult>0</difficult>
+\t\t<bndbox>
+\t\t\t<xmin>10</xmin>
+\t\t\t<ymin>20</ymin>
+\t\t\t<xmax>110</xmax>
+\t\t\t<ymax>220</ymax>
+\t\t</bndbox>
+\t</object>
+</annotation>
+'''
+
+
+def test_empty_label_set(tmp_path):
+    annotations = LabelCache(str(tmp_path / 'labels.npz'), str(tmp_path)).load_annotations([])
+
+    assert len(annotations) == 0
+    assert annotations.num_boxes == 0
+
+
+def test_cache_file_without_rows(tmp_path):
+    # Invalid label files are not cached, the saved cache file holds zero rows
+    (tmp_path / 'im007.xml').write_bytes(LABEL_FILE[:LABEL_FILE.rindex(b'</annotation>')])
+    cache_file = str(tmp_path / 'labels.npz')
+
+    errors = []
+    LabelCache(cache_file, str(tmp_path)).load_annotations(['im007.xml'], errors=errors)
+    annotations = LabelCache(cache_file, str(tmp_path)).load_annotations([])
+
+    assert len(errors) == 1
+    assert len(annotations) == 0
+    assert annotations.bbox.shape == (0, 4)
+
+
+def test_cached_label_files(tmp_path):
+    (tmp_path / 'im007.xml').write_bytes(LABEL_FILE)
+    cache_file = str(tmp_path / 'labels.npz')
+
+    parsed = LabelCache(cache_file, str(tmp_path)).load_annotations(['im007.xml'])
+    cached = LabelCache(cache_file, str(tmp_path)).load_annotations(['im007.xml'])
+
+    assert cached.filenames == parsed.filenames == ['im007.png']
+    assert cached.bbox.tolist() == parsed.bbox.tolist() == [[10, 20, 110, 220]]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from util.annotation_store import EMPTY_RECORD, AnnotationStore, read_label_file_checked
+from util.dataset_index import DatasetIndex
+from util.preflight import check_annotations
+
+LABEL_FILE = b'''<annotation>
+\t<folder>Images</folder>
+\t<filename>im007.png</filename>
+\t<size>
+\t\t<width>640</width>
+\t\t<height>480</height>
+\t\t<depth>3</depth>
+\t</size>
+\t<segmented>0</segmented>
+\t<object>
+\t\t<name>0</name>
+\t\t<pose>Unspecified</pose>
+\t\t<truncated>0</truncated>
+\t\t<difficult>0</difficult>
+\t\t<bndbox>
+\t\t\t<xmin>10</xmin>
+\t\t\t<ymin>20</ymin>
+\t\t\t<xmax>110</xmax>
+\t\t\t<ymax>220</ymax>
+\t\t</bndbox>
+\t</object>
+</annotation>
+'''
+
+
+def test_truncated_labelimg_file_is_not_well_formed(tmp_path):
+    # Cut off after the last object, the boxes alone look complete
+    (tmp_path / 'im007.xml').write_bytes(LABEL_FILE[:LABEL_FILE.rindex(b'</object>') + len(b'</object>')])
+
+    record, error = read_label_file_checked(str(tmp_path / 'im007.xml'))
+
+    assert record == EMPTY_RECORD
+    assert error[0] == 'not_well_formed'
+
+
+def test_preflight_reports_truncated_labelimg_file(tmp_path):
+    (tmp_path / 'im006.xml').write_bytes(LABEL_FILE)
+    (tmp_path / 'im007.xml').write_bytes(LABEL_FILE[:LABEL_FILE.rindex(b'</annotation>')])
+
+    index = DatasetIndex('png', 'png')
+    index.add_set('train', ['im006', 'im007'])
+
+    errors = []
+    annotations = AnnotationStore.from_label_files(str(tmp_path), index.label_files(), errors=errors)
+    issues = check_annotations(annotations, index, str(tmp_path), np.ones(2, dtype=bool), errors)
+
+    assert [(issue['label_file'], issue['check']) for issue in issues] == [
+        (str(tmp_path / 'im007.xml'), 'not_well_formed')]
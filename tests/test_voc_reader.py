@@ -0,0 +1,62 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from util.voc_reader import read_label_file, read_label_file_etree
+
+LABEL_FILE = b'''<annotation verified="yes">
+\t<folder>Images</folder>
+\t<filename>im007.png</filename>
+\t<path>/data/Images/im007.png</path>
+\t<source>
+\t\t<database>Unknown</database>
+\t</source>
+\t<size>
+\t\t<width>640</width>
+\t\t<height>480</height>
+\t\t<depth>3</depth>
+\t</size>
+\t<segmented>0</segmented>
+\t<object>
+\t\t<name>3</name>
+\t\t<pose>Unspecified</pose>
+\t\t<truncated>0</truncated>
+\t\t<difficult>0</difficult>
+\t\t<bndbox>
+\t\t\t<xmin>10</xmin>
+\t\t\t<ymin>20</ymin>
+\t\t\t<xmax>110</xmax>
+\t\t\t<ymax>220</ymax>
+\t\t</bndbox>
+\t</object>
+</annotation>
+'''
+
+
+def write(tmp_path, data):
+    label_file = tmp_path / 'im007.xml'
+    label_file.write_bytes(data)
+
+    return str(label_file)
+
+
+def test_labelimg_file(tmp_path):
+    label_file = write(tmp_path, LABEL_FILE)
+
+    assert read_label_file(label_file) == ('im007.png', 640, 480, True, [(4, 10, 20, 110, 220)])
+    assert read_label_file(label_file) == read_label_file_etree(label_file)
+
+
+@pytest.mark.parametrize('data', [
+    LABEL_FILE[:LABEL_FILE.rindex(b'</object>') + len(b'</object>')],
+    LABEL_FILE[:LABEL_FILE.rindex(b'</annotation>')],
+    LABEL_FILE.replace(b'</segmented>', b'</segmentd>'),
+    LABEL_FILE + b'<annotation>',
+], ids=['truncated_after_object', 'truncated_root', 'mismatched_tag', 'second_root'])
+def test_malformed_file_raises_like_element_tree(tmp_path, data):
+    label_file = write(tmp_path, data)
+
+    with pytest.raises(ET.ParseError):
+        read_label_file_etree(label_file)
+    with pytest.raises(ET.ParseError):
+        read_label_file(label_file)
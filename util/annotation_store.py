@@ -0,0 +1,216 @@
+import multiprocessing
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from tqdm import tqdm
+
+from util.io_order import READAHEAD_WINDOW, Readahead, disk_order, with_readahead
+from util.voc_reader import ClassIdError, read_label_file
+
+# Record of a label file which could not be read
+EMPTY_RECORD = (None, 0, 0, False, [])
+
+
+def read_label_file_checked(label_file):
+    """ Reads a label file like read_label_file, but returns errors instead of raising them. Every file is checked to
+    be well-formed, also the ones read by the fast path (see util.voc_reader.read_label_file).
+    :return: Tuple of the record (EMPTY_RECORD on error) and None or a tuple (check, message) describing the error
+    """
+
+    try:
+        return read_label_file(label_file), None
+    except ET.ParseError as e:
+        return EMPTY_RECORD, ('not_well_formed', 'Label file not well-formed: {}'.format(e))
+    except ClassIdError as e:
+        return EMPTY_RECORD, ('non_integer_class_id', str(e))
+    except (ValueError, AttributeError, IndexError, TypeError) as e:
+        return EMPTY_RECORD, ('invalid_structure', 'Label file has an unexpected structure: {!r}'.format(e))
+
+
+def _read(task):
+    return with_readahead(*task)
+
+
+class AnnotationStore:
+    """ Columnar store for all objects of a dataset.
+
+    Every label file is parsed once. Image fields are stored per label file (row), object fields are stored per
+    object and grouped by row, the objects of row r are found at box_offsets[r]:box_offsets[r + 1]. The store does not
+    hold the label files, the rows of a dataset are the stem ids of its util.dataset_index.DatasetIndex.
+    """
+
+    def __init__(self, filenames, width, height, verified, box_offsets, class_id, bbox):
+        # Image fields
+        self.filenames = filenames
+        self.width = width
+        self.height = height
+        self.verified = verified
+
+        # Object fields
+        self.box_offsets = box_offsets
+        self.image = np.repeat(np.arange(len(width), dtype=np.int64), np.diff(box_offsets))
+        self.class_id = class_id
+        self.bbox = bbox
+        self.xmin = bbox[:, 0]
+        self.ymin = bbox[:, 1]
+        self.xmax = bbox[:, 2]
+        self.ymax = bbox[:, 3]
+
+    @classmethod
+    def from_label_files(cls, label_path, label_files, workers=1, errors=None, io_order='logical'):
+        """ Parses the label files, with workers > 1 in a process pool. The rows keep the order of label_files.
+
+        When errors is None the first invalid label file ends the program. Otherwise a tuple (label_file, check,
+        message) is appended to errors for each invalid label file and the file is stored without objects.
+
+        With io_order other than 'logical' the files are read in disk order (see util.io_order.disk_order) with
+        readahead hints and the results are put back into the order of label_files.
+        """
+        time.sleep(0.1)
+        print('\nParsing label files ...')
+        time.sleep(0.1)
+
+        order = disk_order([os.path.join(label_path, label_file) for label_file in label_files], io_order)
+        paths = [os.path.join(label_path, label_files[i]) for i in order]
+        reader = read_label_file if errors is None else read_label_file_checked
+
+        readahead = Readahead(paths if io_order != 'logical' else [])
+        readahead.advance(0)
+
+        try:
+            if workers > 1 and len(paths) > 1:
+                chunksize = max(1, min(256, len(paths) // (workers * 8)))
+
+                # The workers run ahead of the results, so every task hints the file one readahead window ahead
+                hints = paths[READAHEAD_WINDOW:] if io_order != 'logical' else []
+                tasks = [(hints[i] if i < len(hints) else None, reader, path) for i, path in enumerate(paths)]
+
+                with multiprocessing.Pool(workers) as pool:
+                    ordered_results = list(tqdm(pool.imap(_read, tasks, chunksize=chunksize), total=len(paths),
+                                                unit='files', desc='\tProgress'))
+            else:
+                ordered_results = []
+                for path in tqdm(paths, unit='files', desc='\tProgress'):
+                    ordered_results.append(reader(path))
+                    readahead.advance(len(ordered_results))
+        except ValueError as e:
+            print('\nError: {}'.format(e))
+            sys.exit(-1)
+
+        results = [None] * len(paths)
+        for i, result in zip(order.tolist(), ordered_results):
+            results[i] = result
+
+        if errors is None:
+            return cls.from_records(results)
+
+        for label_file, (_, error) in zip(label_files, results):
+            if error is not None:
+                errors.append((label_file,) + error)
+
+        return cls.from_records([record for record, _ in results])
+
+    @classmethod
+    def from_records(cls, records):
+        num_boxes = [len(objects) for _, _, _, _, objects in records]
+
+        box_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        np.cumsum(num_boxes, out=box_offsets[1:])
+
+        objects = np.array([obj for _, _, _, _, objects in records for obj in objects],
+                           dtype=np.int32).reshape(-1, 5)
+
+        return cls(filenames=[filename for filename, _, _, _, _ in records],
+                   width=np.array([width for _, width, _, _, _ in records], dtype=np.int32),
+                   height=np.array([height for _, _, height, _, _ in records], dtype=np.int32),
+                   verified=np.array([verified for _, _, _, verified, _ in records], dtype=bool),
+                   box_offsets=box_offsets,
+                   class_id=objects[:, 0],
+                   bbox=objects[:, 1:])
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(filenames=arrays['filenames'].tolist(),
+                   width=arrays['width'],
+                   height=arrays['height'],
+                   verified=arrays['verified'],
+                   box_offsets=arrays['box_offsets'],
+                   class_id=arrays['class_id'],
+                   bbox=arrays['bbox'])
+
+    @classmethod
+    def concatenate(cls, stores):
+        box_offsets = np.zeros(sum(len(store) for store in stores) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate([np.diff(store.box_offsets) for store in stores]), out=box_offsets[1:])
+
+        return cls(filenames=[filename for store in stores for filename in store.filenames],
+                   width=np.concatenate([store.width for store in stores]).astype(np.int32),
+                   height=np.concatenate([store.height for store in stores]).astype(np.int32),
+                   verified=np.concatenate([store.verified for store in stores]).astype(bool),
+                   box_offsets=box_offsets,
+                   class_id=np.concatenate([store.class_id for store in stores]).astype(np.int32),
+                   bbox=np.concatenate([store.bbox for store in stores]).astype(np.int32).reshape(-1, 4))
+
+    def to_arrays(self):
+        return {'filenames': np.array(self.filenames, dtype=str),
+                'width': self.width,
+                'height': self.height,
+                'verified': self.verified,
+                'box_offsets': self.box_offsets,
+                'class_id': self.class_id,
+                'bbox': self.bbox}
+
+    def take(self, rows):
+        """ Returns a new store holding only the given rows in the given order.
+        """
+        indices, _ = self.box_indices(rows)
+
+        box_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(self.box_offsets[rows + 1] - self.box_offsets[rows], out=box_offsets[1:])
+
+        return AnnotationStore(filenames=[self.filenames[row] for row in rows],
+                               width=self.width[rows],
+                               height=self.height[rows],
+                               verified=self.verified[rows],
+                               box_offsets=box_offsets,
+                               class_id=self.class_id[indices],
+                               bbox=self.bbox[indices])
+
+    def resized(self, geometry):
+        """ Returns a new store with the image sizes and boxes of resized images.
+        :param geometry: Dict of per row arrays, see util.resize.resize_geometry
+        """
+        scale = np.stack([geometry['scale_x'], geometry['scale_y']] * 2, axis=1)[self.image]
+        pad = np.stack([geometry['pad_x'], geometry['pad_y']] * 2, axis=1)[self.image]
+        size = np.stack([geometry['width'], geometry['height']] * 2, axis=1)[self.image]
+
+        bbox = np.clip(np.rint(self.bbox * scale + pad), 0, size)
+
+        return AnnotationStore(filenames=self.filenames,
+                               width=geometry['width'].astype(np.int32),
+                               height=geometry['height'].astype(np.int32),
+                               verified=self.verified,
+                               box_offsets=self.box_offsets,
+                               class_id=self.class_id,
+                               bbox=bbox.astype(np.int32))
+
+    def __len__(self):
+        return len(self.width)
+
+    @property
+    def num_boxes(self):
+        return len(self.class_id)
+
+    def box_indices(self, rows):
+        """ Returns the indices of all objects of the given rows in row order and the position of their row.
+        """
+        starts = self.box_offsets[rows]
+        counts = self.box_offsets[rows + 1] - starts
+
+        positions = np.repeat(np.arange(len(rows), dtype=np.int64), counts)
+        indices = np.arange(counts.sum(), dtype=np.int64) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+
+        return indices, positions
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+
+class DatasetIndex:
+    """ Compact index of the images and label files of a dataset.
+
+    Every file pair is stored once as interned stem (path relative to the image and label dir without extension),
+    the extensions are stored once for the whole dataset. Sets are NumPy arrays of stem ids, so splitting and
+    shuffling only moves integers around. Stem ids are also the rows of the AnnotationStore.
+
+    With fan_out > 0 output files are placed in fan_out levels of sub dirs named by a hash of the file name
+    (e.g. ab/cd/<file>), so no output dir holds more than a few thousand entries.
+    """
+
+    def __init__(self, image_ext, output_ext, label_ext='xml', fan_out=0):
+        self.image_ext = image_ext
+        self.output_ext = output_ext
+        self.label_ext = label_ext
+        self.fan_out = fan_out
+
+        self.stems = []
+        self.sets = {}
+
+        self._stem_ids = {}
+
+    def __len__(self):
+        return len(self.stems)
+
+    def add_set(self, image_set, stems):
+        """ Adds a set, stems already known from another set are not stored twice.
+        """
+        ids = np.empty(len(stems), dtype=np.int64)
+
+        for i, stem in enumerate(stems):
+            stem_id = self._stem_ids.get(stem)
+
+            if stem_id is None:
+                stem_id = len(self.stems)
+                self._stem_ids[stem] = stem_id
+                self.stems.append(sys.intern(stem))
+
+            ids[i] = stem_id
+
+        self.sets[image_set] = ids
+
+        return ids
+
+    def image_file(self, stem_id):
+        return '{}.{}'.format(self.stems[stem_id], self.image_ext)
+
+    def label_file(self, stem_id):
+        return '{}.{}'.format(self.stems[stem_id], self.label_ext)
+
+    def output_file(self, stem_id, ext=None):
+        """ Returns the path of an image (or e.g. a label file with ext='txt') relative to an output set dir.
+        """
+        name = os.path.basename(self.stems[stem_id])
+        output_file = '{}.{}'.format(name, self.output_ext if ext is None else ext)
+
+        if self.fan_out == 0:
+            return output_file
+
+        # Hash the name without extension, so images and label files of a stem end up in the same dir
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(*[digest[2 * i:2 * i + 2] for i in range(self.fan_out)], output_file)
+
+    def label_files(self, image_set=None):
+        """ Returns the label files of a set or of all stems when no set is given.
+        """
+        if image_set is None:
+            return [self.label_file(stem_id) for stem_id in range(len(self.stems))]
+
+        return [self.label_file(stem_id) for stem_id in self.sets[image_set]]
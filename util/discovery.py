@@ -0,0 +1,54 @@
+import os
+from collections import namedtuple
+
+Pairing = namedtuple('Pairing', ['stems', 'unmatched_images', 'unmatched_labels', 'missing'])
+
+
+def scan_dir(path, extension, recursive=False):
+    """ Scans a directory once with os.scandir.
+    :param path: Directory to scan
+    :param extension: File extension without dot, other files are ignored
+    :param recursive: Scans subdirectories (e.g. shards) when set
+    :return: Dict mapping the stem (path relative to the directory without extension) to the os.DirEntry of the file
+    """
+
+    files = {}
+    suffix = '.' + extension
+    sub_dirs = ['']
+
+    while len(sub_dirs) > 0:
+        sub_dir = sub_dirs.pop()
+
+        with os.scandir(os.path.join(path, sub_dir)) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix) and entry.is_file():
+                    files[os.path.join(sub_dir, entry.name[:-len(suffix)])] = entry
+                elif recursive and entry.is_dir():
+                    sub_dirs.append(os.path.join(sub_dir, entry.name))
+
+    return files
+
+
+def pair_by_stem(image_entries, label_entries, stems=None):
+    """ Pairs images and label files by stem with a hash join.
+    :param image_entries: Dict stem -> os.DirEntry of the images
+    :param label_entries: Dict stem -> os.DirEntry of the label files
+    :param stems: Stems to pair, e.g. from a file list. When None all scanned images are paired.
+    :return: Pairing with the paired stems (in order of stems or of the image scan), the paths of images without
+             label file, the paths of label files without image and the stems with neither image nor label file.
+    """
+
+    if stems is None:
+        paired = [stem for stem in image_entries if stem in label_entries]
+        unmatched_images = [entry.path for stem, entry in image_entries.items() if stem not in label_entries]
+        unmatched_labels = [entry.path for stem, entry in label_entries.items() if stem not in image_entries]
+        missing = []
+    else:
+        paired = [stem for stem in stems if stem in image_entries and stem in label_entries]
+        unmatched_images = [image_entries[stem].path for stem in stems
+                            if stem in image_entries and stem not in label_entries]
+        unmatched_labels = [label_entries[stem].path for stem in stems
+                            if stem in label_entries and stem not in image_entries]
+        missing = [stem for stem in stems if stem not in image_entries and stem not in label_entries]
+
+    return Pairing(paired, unmatched_images, unmatched_labels, missing)
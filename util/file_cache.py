@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+
+from util.util import create_dir
+
+
+class FileCache:
+    """ Base of the persistent caches of per file results, keyed by the path of the file relative to a dir, its byte
+    size and mtime.
+
+    The cache is a compressed .npz file holding the version, the dir, the relative files, their size and mtime and one
+    value per file in every column. Subclasses name their columns, compute the results of new or changed files (see
+    misses) and add them with _add_rows.
+    """
+
+    version = 1
+
+    # Name and dir in messages, key of the dir in the cache file
+    name = 'Cache'
+    path_name = 'dir'
+    path_key = 'path'
+    indent = ''
+
+    # Columns of numpy arrays (first axis per file) and of lists of strings
+    columns = []
+    str_columns = []
+
+    def __init__(self, cache_file, path):
+        self.cache_file = cache_file
+        self.path = os.path.abspath(path)
+
+        self.files = []
+        self.size = np.zeros(0, dtype=np.int64)
+        self.mtime_ns = np.zeros(0, dtype=np.int64)
+
+        self.index = {}
+        self.loaded = False
+
+    def clear(self):
+        if os.path.isfile(self.cache_file):
+            os.remove(self.cache_file)
+            print('{}Removed {}: {}'.format(self.indent, self.name.lower(), self.cache_file))
+
+    def stat(self, files, entries=None):
+        """ Returns byte size and mtime (ns) of the files.
+        :param files: Files relative to the dir
+        :param entries: Optional os.DirEntry (or None) per file to avoid additional stat calls
+        """
+        stats = []
+        for i, file in enumerate(files):
+            entry = None if entries is None else entries[i]
+            stat = os.stat(os.path.join(self.path, file)) if entry is None else entry.stat()
+            stats.append((stat.st_size, stat.st_mtime_ns))
+
+        return stats
+
+    def misses(self, files, stats):
+        """ Returns the positions of the files which are not cached or changed since.
+        """
+        return [i for i, file in enumerate(files)
+                if file not in self.index or (self.size[self.index[file]], self.mtime_ns[self.index[file]]) != stats[i]]
+
+    def rows(self, files):
+        """ Returns the rows of the files in the cache.
+        """
+        return np.array([self.index[file] for file in files], dtype=np.int64)
+
+    def _add_rows(self, files, stats):
+        """ Adds rows for new files and sets size and mtime of the files, the columns of new rows are zero.
+        :return: Rows of the files
+        """
+        rows = []
+        for file in files:
+            row = self.index.get(file)
+
+            if row is None:
+                row = len(self.files)
+                self.index[file] = row
+                self.files.append(file)
+
+            rows.append(row)
+
+        num_rows = len(self.files)
+        for column in ['size', 'mtime_ns'] + self.columns:
+            values = getattr(self, column)
+            setattr(self, column, np.concatenate([values, np.zeros((num_rows - len(values),) + values.shape[1:],
+                                                                   dtype=values.dtype)]))
+        for column in self.str_columns:
+            values = getattr(self, column)
+            values += [''] * (num_rows - len(values))
+
+        rows = np.array(rows, dtype=np.int64)
+        self.size[rows] = [size for size, _ in stats]
+        self.mtime_ns[rows] = [mtime_ns for _, mtime_ns in stats]
+
+        return rows
+
+    def _load(self):
+        """ Loads the cache file once, rows added before are kept.
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+
+        if not os.path.isfile(self.cache_file):
+            return
+
+        try:
+            with np.load(self.cache_file) as data:
+                if int(data['version']) != self.version or str(data[self.path_key]) != self.path:
+                    print('{}{} was created for another version or {}, rebuilding it.'.format(self.indent, self.name,
+                                                                                              self.path_name))
+                    return
+
+                # Only the columns in use are read
+                self._from_arrays(data)
+        except (OSError, ValueError, KeyError):
+            print('{}{} could not be read, rebuilding it.'.format(self.indent, self.name))
+            return
+
+        self.index = {file: row for row, file in enumerate(self.files)}
+
+    def _save(self):
+        create_dir(os.path.dirname(os.path.abspath(self.cache_file)))
+
+        # The cache file is replaced at once, so an interrupted save keeps the previous cache
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez_compressed(f, version=self.version, **{self.path_key: self.path}, **self._to_arrays())
+        os.replace(tmp_file, self.cache_file)
+
+    def _from_arrays(self, arrays):
+        files = arrays['files'].tolist()
+        columns = {column: arrays[column] for column in ['size', 'mtime_ns'] + self.columns}
+        str_columns = {column: arrays[column].tolist() for column in self.str_columns}
+
+        self.files = files
+        for column, values in list(columns.items()) + list(str_columns.items()):
+            setattr(self, column, values)
+
+    def _to_arrays(self):
+        arrays = {column: getattr(self, column) for column in ['size', 'mtime_ns'] + self.columns}
+        arrays.update((column, np.array(getattr(self, column), dtype=str)) for column in self.str_columns)
+        arrays['files'] = np.array(self.files, dtype=str)
+
+        return arrays
@@ -0,0 +1,162 @@
+import hashlib
+import multiprocessing
+import os
+import struct
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from util.file_cache import FileCache
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Channels per PNG color type (gray, RGB, palette, gray + alpha, RGBA)
+PNG_CHANNELS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+
+# JPEG start of frame markers, C4 (DHT), C8 (JPG) and CC (DAC) use the same range but are no frames
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def probe_image(image_file):
+    """ Reads width, height and channels from the PNG IHDR or JPEG SOF header without decoding the image.
+    :return: Tuple (width, height, channels), None when the header could not be read
+    """
+
+    with open(image_file, 'rb') as f:
+        head = f.read(26)
+
+        if head.startswith(PNG_SIGNATURE):
+            if len(head) < 26 or head[12:16] != b'IHDR':
+                return None
+
+            width, height = struct.unpack('>II', head[16:24])
+            return width, height, PNG_CHANNELS.get(head[25], 0)
+
+        if head.startswith(b'\xff\xd8'):
+            f.seek(2)
+            return _probe_jpeg(f)
+
+    return None
+
+
+def _probe_jpeg(f):
+    while True:
+        marker = f.read(2)
+
+        # Skip fill bytes
+        while len(marker) == 2 and marker[0] == 0xFF and marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        # Markers without segment
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+            continue
+
+        segment_length = f.read(2)
+        if len(segment_length) < 2:
+            return None
+        segment_length = struct.unpack('>H', segment_length)[0]
+
+        if marker[1] in JPEG_SOF_MARKERS:
+            frame = f.read(6)
+            if len(frame) < 6:
+                return None
+
+            _, height, width, channels = struct.unpack('>BHHB', frame)
+            return width, height, channels
+
+        # Start of scan or end of image before a frame header
+        if marker[1] in (0xDA, 0xD9):
+            return None
+
+        f.seek(segment_length - 2, os.SEEK_CUR)
+
+
+def hash_file(path, chunk_size=1 << 20):
+    content_hash = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            content_hash.update(chunk)
+
+    return content_hash.hexdigest()
+
+
+def catalog_entry(image_file):
+    """ Returns width, height, channels (-1 when unknown) and the content hash of an image.
+    """
+    size = probe_image(image_file)
+    if size is None:
+        size = (-1, -1, -1)
+
+    return size + (hash_file(image_file),)
+
+
+class ImageCatalog(FileCache):
+    """ Persistent catalog of image metadata, see util.file_cache.FileCache.
+
+    The catalog holds width, height, channels and content hash of every image. Dimensions are read from the image
+    headers, only new or changed images are read on an update.
+    """
+
+    version = 2
+    name = 'Image catalog'
+    path_name = 'image dir'
+    path_key = 'image_path'
+    columns = ['width', 'height', 'channels']
+    str_columns = ['hash']
+
+    def __init__(self, catalog_file, image_path):
+        super().__init__(catalog_file, image_path)
+
+        self.width = np.zeros(0, dtype=np.int64)
+        self.height = np.zeros(0, dtype=np.int64)
+        self.channels = np.zeros(0, dtype=np.int64)
+        self.hash = []
+
+    def update(self, image_files, workers=1, entries=None):
+        """ Adds new and changed images to the catalog and saves it.
+        :param image_files: Image files relative to the image path
+        :param workers: Number of processes used to read new or changed images
+        :param entries: Optional os.DirEntry (or None) per image file to avoid additional stat calls
+        :return: Rows of the image files in the catalog
+        """
+        self._load()
+
+        stats = self.stat(image_files, entries)
+        misses = self.misses(image_files, stats)
+
+        print('\nImage catalog: {} of {} images up to date.'.format(len(image_files) - len(misses), len(image_files)))
+
+        if len(misses) > 0:
+            time.sleep(0.1)
+            print('Reading image headers ...')
+            time.sleep(0.1)
+
+            paths = [os.path.join(self.path, image_files[i]) for i in misses]
+
+            if workers > 1 and len(paths) > 1:
+                chunksize = max(1, min(256, len(paths) // (workers * 8)))
+                with multiprocessing.Pool(workers) as pool:
+                    results = list(tqdm(pool.imap(catalog_entry, paths, chunksize=chunksize),
+                                        total=len(paths), unit='files', desc='\tProgress'))
+            else:
+                results = [catalog_entry(path) for path in tqdm(paths, unit='files', desc='\tProgress')]
+
+            self._add([image_files[i] for i in misses], [stats[i] for i in misses], results)
+            self._save()
+
+        return self.rows(image_files)
+
+    def _add(self, image_files, stats, results):
+        rows = self._add_rows(image_files, stats)
+
+        self.width[rows] = [width for width, _, _, _ in results]
+        self.height[rows] = [height for _, height, _, _ in results]
+        self.channels[rows] = [channels for _, _, channels, _ in results]
+
+        for row, (_, _, _, content_hash) in zip(rows.tolist(), results):
+            self.hash[row] = content_hash
@@ -0,0 +1,124 @@
+import io
+import multiprocessing
+import os
+import struct
+import time
+import zlib
+from functools import partial
+
+import cv2
+from tqdm import tqdm
+
+from util.image_catalog import PNG_SIGNATURE
+
+# Number of bytes at the end of a JPEG searched for the EOI marker, some cameras pad files with zeros
+JPEG_TAIL_SIZE = 1024
+
+
+def check_image(image_file, decode=False):
+    """ Checks the structure of a PNG (chunk CRCs and IEND) or JPEG (SOI and EOI marker) without decoding it.
+    :param image_file: Path to the image
+    :param decode: Also decodes the image when set
+    :return: None for a valid image, otherwise a tuple (check, message)
+    """
+
+    try:
+        with open(image_file, 'rb') as f:
+            error = _check_structure(f, image_file)
+    except OSError as e:
+        return 'unreadable', 'Image could not be read: {}'.format(e)
+
+    if error is None and decode and cv2.imread(image_file, cv2.IMREAD_UNCHANGED) is None:
+        error = 'not_decodable', 'Image could not be decoded.'
+
+    return error
+
+
+def check_image_data(data, image_file):
+    """ Checks the structure of an image already read into memory, see check_image.
+    :param data: Content of the image file
+    :param image_file: Path to the image, the extension is used for files without signature
+    :return: None for a valid image, otherwise a tuple (check, message)
+    """
+    return _check_structure(io.BytesIO(data), image_file)
+
+
+def _check_structure(f, image_file):
+    head = f.read(8)
+
+    if head.startswith(PNG_SIGNATURE):
+        return _check_png(f)
+    if head.startswith(b'\xff\xd8'):
+        return _check_jpeg(f)
+    if os.path.splitext(image_file)[1].lower() in ('.png', '.jpg', '.jpeg'):
+        return 'invalid_signature', 'File does not start with a PNG or JPEG signature.'
+
+    return None
+
+
+def _check_png(f):
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return 'truncated', 'PNG ends before the IEND chunk.'
+
+        length, chunk_type = struct.unpack('>I4s', header)
+        data = f.read(length)
+        crc = f.read(4)
+
+        if len(data) < length or len(crc) < 4:
+            return 'truncated', 'PNG chunk {} is truncated.'.format(chunk_type.decode('latin-1'))
+
+        if zlib.crc32(data, zlib.crc32(chunk_type)) != struct.unpack('>I', crc)[0]:
+            return 'crc_mismatch', 'CRC of PNG chunk {} does not match.'.format(chunk_type.decode('latin-1'))
+
+        if chunk_type == b'IEND':
+            return None
+
+
+def _check_jpeg(f):
+    size = f.seek(0, os.SEEK_END)
+    f.seek(max(0, size - JPEG_TAIL_SIZE))
+
+    if not f.read().rstrip(b'\x00').endswith(b'\xff\xd9'):
+        return 'truncated', 'JPEG has no EOI marker.'
+
+    return None
+
+
+def check_images(image_path, image_files, workers=1, decode=False):
+    """ Checks all images, with workers > 1 in a process pool.
+    :return: List of tuples (image_file, check, message) of all invalid images
+    """
+    time.sleep(0.1)
+    print('\nChecking images{} ...'.format(' (full decode)' if decode else ''))
+    time.sleep(0.1)
+
+    paths = [os.path.join(image_path, image_file) for image_file in image_files]
+    checker = partial(check_image, decode=decode)
+
+    if workers > 1 and len(paths) > 1:
+        chunksize = max(1, min(256, len(paths) // (workers * 8)))
+
+        with multiprocessing.Pool(workers) as pool:
+            results = list(tqdm(pool.imap(checker, paths, chunksize=chunksize), total=len(paths),
+                                unit='files', desc='\tProgress'))
+    else:
+        results = [checker(path) for path in tqdm(paths, unit='files', desc='\tProgress')]
+
+    return [(image_file,) + error for image_file, error in zip(image_files, results) if error is not None]
+
+
+def write_quarantine_list(quarantine_file, issues):
+    """ Writes one line 'image file<TAB>check<TAB>message' per quarantined image.
+    """
+    with open(quarantine_file, 'w') as file:
+        for image_file, check, message in issues:
+            file.write('{}\t{}\t{}\n'.format(image_file, check, message))
+
+
+def read_quarantine_list(quarantine_file):
+    """ Returns the set of image files of a quarantine list.
+    """
+    with open(quarantine_file) as file:
+        return {line.split('\t')[0].rstrip('\n\r') for line in file if line.strip() and not line.startswith('#')}
@@ -0,0 +1,69 @@
+import io
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from util.image_check import check_image_data
+from util.image_stats import pixel_histogram
+from util.resize import resize_array
+from util.transcode import encode_image
+
+
+def process_image(src, dst, options, geometry=None, histogram=False):
+    """ Converts an image with a single read and decode. The stages run on the decoded image in one worker: structure
+    check of the read bytes, histogram for the image statistics, resize and encode.
+    :param src: Source image
+    :param dst: Destination image, the format is given by its extension
+    :param options: Codec options, see util.transcode.transcode_options
+    :param geometry: Geometry when the image is resized, see util.resize.resize_array
+    :param histogram: Computes the histogram of the source image when set, see util.image_stats.empty_histogram
+    :return: Tuple of source size in bytes, destination size in bytes and the histogram (None when not computed)
+    """
+    with open(src, 'rb') as f:
+        data = f.read()
+
+    error = check_image_data(data, src)
+    if error is not None:
+        raise OSError('Invalid image {} ({}): {} Use --check-images to skip invalid images.'.format(src, error[0],
+                                                                                                   error[1]))
+
+    image = decode_image(data)
+    if image is None:
+        raise OSError('Image could not be decoded: {}'.format(src))
+
+    image_histogram = pixel_histogram(image) if histogram else None
+
+    if geometry is not None:
+        image = resize_array(image, geometry)
+
+    # dst may be a link to the source image or a stored image left by an earlier run, so it is replaced, never written
+    # through
+    fd, tmp_file = tempfile.mkstemp(prefix='.', suffix=os.path.splitext(dst)[1], dir=os.path.dirname(dst) or '.')
+    os.close(fd)
+
+    try:
+        encode_image(image, tmp_file, options)
+        os.replace(tmp_file, dst)
+    finally:
+        if os.path.lexists(tmp_file):
+            os.remove(tmp_file)
+
+    return len(data), os.path.getsize(dst), image_histogram
+
+
+def decode_image(data):
+    """ Decodes an image with OpenCV, the same decoder as for the image statistics. Formats OpenCV can't read are
+    decoded with PIL. The EXIF orientation is ignored like by PIL, as the label coordinates refer to the stored pixels.
+    :return: Image as uint8 array (height, width, 3) in BGR order, None when the image could not be decoded
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is not None:
+        return image
+
+    try:
+        return np.ascontiguousarray(np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))[:, :, ::-1])
+    except OSError:
+        return None
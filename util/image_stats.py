@@ -0,0 +1,264 @@
+import multiprocessing
+from functools import partial
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from util.io_order import Readahead
+
+# Decode flags by downscale factor, libjpeg scales JPEG images down while decoding (DCT scaling). The EXIF orientation
+# is ignored like by PIL, so the pixels match the ones written to the output dirs and the label coordinates.
+REDUCED_DECODE = {1: cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION,
+                  2: cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+                  4: cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+                  8: cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION}
+
+# Quantile of the standard normal distribution for 95 % confidence intervals
+Z_95 = 1.959963984540054
+
+# Number of images sampled per set before the confidence intervals are trusted
+MIN_SAMPLE = 30
+
+# Number of pixels counted at once, bounds the temporary memory of np.bincount
+HISTOGRAM_CHUNK = 1 << 20
+
+INTENSITIES = np.arange(256, dtype=np.int64)
+
+PERCENTILES = [0.1, 1, 5, 25, 50, 75, 95, 99, 99.9]
+
+
+def empty_histogram():
+    """ Returns the histogram of no pixels: 256 bins of pixel counts per channel (RGB, int64). Histograms are merged by
+    adding them, the result never depends on the order and all statistics derived from them are exact.
+    """
+    return np.zeros((3, 256), dtype=np.int64)
+
+
+def image_histogram(path, reduce=1):
+    """ Decodes an image and returns its histogram, see empty_histogram. None when the image could not be read.
+    :param path: Image
+    :param reduce: Downscale factor of the decode, see REDUCED_DECODE
+    """
+    image = cv2.imread(path, REDUCED_DECODE[reduce])
+    if image is None:
+        return None
+
+    return pixel_histogram(image)
+
+
+def pixel_histogram(image):
+    """ Returns the histogram of a decoded BGR image, see empty_histogram. The uint8 buffer is counted in chunks, so
+    the memory besides the image is bounded by HISTOGRAM_CHUNK.
+    """
+    values = np.ascontiguousarray(image).reshape(-1)
+    histogram = empty_histogram()
+
+    for start in range(0, len(values), HISTOGRAM_CHUNK * 3):
+        chunk = values[start:start + HISTOGRAM_CHUNK * 3]
+
+        # OpenCV decodes to BGR
+        for i, channel in enumerate([2, 1, 0]):
+            histogram[i] += np.bincount(chunk[channel::3], minlength=256)
+
+    return histogram
+
+
+def chunk_histogram(paths, hint=False):
+    """ Accumulates the histogram of a chunk of images in a worker process.
+    :return: Tuple of the histogram and the list of unreadable images
+    """
+    histogram = empty_histogram()
+    unreadable = []
+
+    readahead = Readahead(paths if hint else [])
+    readahead.advance(0)
+
+    for i, path in enumerate(paths):
+        readahead.advance(i + 1)
+        result = image_histogram(path)
+
+        if result is None:
+            unreadable.append(path)
+        else:
+            histogram += result
+
+    return histogram, unreadable
+
+
+def calc_histogram(paths, workers=1, hint=False):
+    """ Computes the histogram of all images, with workers > 1 in a process pool. Every task returns the histogram of
+    a chunk of images, so the memory does not grow with the number of images.
+    :param paths: Images in the order they are read
+    :param workers: Number of worker processes
+    :param hint: Hints the kernel to read ahead of the images decoded when set
+    :return: Tuple of the histogram and the list of unreadable images
+    """
+    chunksize = max(1, min(256, len(paths) // (max(1, workers) * 8)))
+    chunks = [paths[i:i + chunksize] for i in range(0, len(paths), chunksize)]
+    worker = partial(chunk_histogram, hint=hint)
+
+    histogram = empty_histogram()
+    unreadable = []
+
+    with tqdm(total=len(paths), desc="\tProgress:", unit="files") as progress:
+        if workers > 1 and len(chunks) > 1:
+            with multiprocessing.Pool(workers) as pool:
+                for (chunk_result, chunk_unreadable), chunk in zip(pool.imap(worker, chunks), chunks):
+                    histogram += chunk_result
+                    unreadable += chunk_unreadable
+                    progress.update(len(chunk))
+        else:
+            for chunk in chunks:
+                chunk_result, chunk_unreadable = worker(chunk)
+                histogram += chunk_result
+                unreadable += chunk_unreadable
+                progress.update(len(chunk))
+
+    return histogram, unreadable
+
+
+def histogram_moments(histogram):
+    """ Returns the pixel count and the per channel sum and sum of squares (int64) of a histogram.
+    """
+    return int(histogram[0].sum()), histogram @ INTENSITIES, histogram @ INTENSITIES ** 2
+
+
+def mean_std(histogram):
+    """ Returns the exact mean and (population) standard deviation per channel of a histogram, see moments_mean_std.
+    """
+    return moments_mean_std(*histogram_moments(histogram))
+
+
+def moments_mean_std(count, sums, squares):
+    """ Returns the exact mean and (population) standard deviation per channel of the pixel count and the per channel
+    sums and sums of squares (int64). The variance is computed from the integer sums with Python integers, so there is
+    neither overflow nor cancellation.
+    """
+    count = int(count)
+    if count == 0:
+        return np.full(3, np.nan), np.full(3, np.nan)
+
+    mean = np.array([int(s) / count for s in sums])
+    var = np.array([(count * int(q) - int(s) ** 2) / count ** 2 for s, q in zip(sums, squares)])
+
+    return mean, np.sqrt(var)
+
+
+def histogram_stats(histogram):
+    """ Returns the statistics of a histogram as plain dict (per channel lists), see image_stats.json.
+    """
+    count = int(histogram[0].sum())
+    mean, std = mean_std(histogram)
+    stats = {'pixels': count, 'mean': mean.tolist(), 'std': std.tolist()}
+
+    # Smallest intensity with at least p percent of the pixels at or below it
+    cumulative = np.cumsum(histogram, axis=1)
+    stats['percentiles'] = {str(p): [int(np.searchsorted(cumulative[i], p / 100 * count)) if count > 0 else None
+                                     for i in range(3)] for p in PERCENTILES}
+
+    stats['clipped_low'] = (histogram[:, 0] / max(count, 1)).tolist()
+    stats['clipped_high'] = (histogram[:, 255] / max(count, 1)).tolist()
+    stats['histogram'] = histogram.tolist()
+
+    return stats
+
+
+def sample_moments(paths, workers=1, reduce=4, tolerance=0.001, rng=None):
+    """ Decodes a random sample of the images at reduced resolution until the 95 % confidence intervals of mean and std
+    are tight enough, see estimate_mean_std.
+    :param paths: Images to sample from
+    :param workers: Number of worker processes
+    :param reduce: Downscale factor of the decode, see REDUCED_DECODE
+    :param tolerance: Stops when all half widths are below tolerance times the estimate
+    :param rng: numpy.random.Generator used to draw the sample
+    :return: Tuple of the per image moments of the sample (arrays of counts, sums and squares), the histogram of the
+             sample and the list of unreadable images
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    paths = [paths[i] for i in rng.permutation(len(paths)).tolist()]
+
+    batch_size = max(MIN_SAMPLE, workers * 16)
+    counts, sums, squares = [], [], []
+    histogram = empty_histogram()
+    unreadable = []
+    worker = partial(image_histogram, reduce=reduce)
+
+    def add(path, result):
+        if result is None:
+            unreadable.append(path)
+        else:
+            histogram[:] += result
+            count, image_sums, image_squares = histogram_moments(result)
+            counts.append(count)
+            sums.append(image_sums)
+            squares.append(image_squares)
+
+        num_read = len(counts) + len(unreadable)
+        if num_read == len(paths) or num_read % batch_size != 0 or len(counts) < MIN_SAMPLE:
+            return False
+
+        sample = _stack(counts, sums, squares)
+        mean, std, mean_ci, std_ci = estimate_mean_std([(len(paths) - len(unreadable),) + sample])
+        return bool(np.all(mean_ci <= tolerance * mean) and np.all(std_ci <= tolerance * std))
+
+    with tqdm(total=len(paths), desc="\tProgress:", unit="files") as progress:
+        if workers > 1 and len(paths) > 1:
+            with multiprocessing.Pool(workers) as pool:
+                for path, result in zip(paths, pool.imap(worker, paths, chunksize=4)):
+                    progress.update(1)
+                    if add(path, result):
+                        break
+        else:
+            for path in paths:
+                progress.update(1)
+                if add(path, worker(path)):
+                    break
+
+    return _stack(counts, sums, squares), histogram, unreadable
+
+
+def _stack(counts, sums, squares):
+    return (np.array(counts, dtype=np.float64), np.array(sums, dtype=np.float64).reshape(-1, 3),
+            np.array(squares, dtype=np.float64).reshape(-1, 3))
+
+
+def estimate_mean_std(strata):
+    """ Estimates mean and std per channel from images sampled without replacement in one or more strata (e.g. sets),
+    with ratio estimators. The confidence intervals are computed by linearization and shrink to 0 once all images of
+    the strata are sampled.
+    :param strata: List of tuples (number of images in the stratum, counts, sums, squares of the sampled images)
+    :return: Tuple of mean, std and the half widths of their 95 % confidence intervals
+    """
+    strata = [stratum for stratum in strata if len(stratum[1]) > 0]
+    if len(strata) == 0:
+        return tuple(np.full(3, np.nan) for _ in range(4))
+
+    # Estimated totals of the pixel count, sums and squares
+    count = sum(num_images * counts.mean() for num_images, counts, _, _ in strata)
+    r1 = sum(num_images * sums.mean(axis=0) for num_images, _, sums, _ in strata) / count
+    r2 = sum(num_images * squares.mean(axis=0) for num_images, _, _, squares in strata) / count
+    std = np.sqrt(np.maximum(r2 - r1 ** 2, 0))
+
+    var_mean = np.zeros(3)
+    var_var = np.zeros(3)
+
+    for num_images, counts, sums, squares in strata:
+        sampled = len(counts)
+        if sampled == num_images:
+            continue
+        if sampled < 2:
+            var_mean[:] = var_var[:] = np.inf
+            continue
+
+        residuals = sums - r1 * counts[:, None]
+        residuals_var = squares - r2 * counts[:, None] - 2 * r1 * residuals
+        factor = num_images ** 2 * (1 - sampled / num_images) / sampled
+
+        var_mean += factor * residuals.var(axis=0, ddof=1)
+        var_var += factor * residuals_var.var(axis=0, ddof=1)
+
+    mean_ci = Z_95 * np.sqrt(var_mean) / count
+    std_ci = Z_95 * np.sqrt(var_var) / count / np.maximum(2 * std, 1e-12)
+
+    return r1, std, mean_ci, std_ci
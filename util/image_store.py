@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from util.image_pipeline import process_image
+from util.materialize import materialize_file
+from util.util import create_dir
+
+OBJECTS_DIR = 'objects'
+REFS_DIR = 'refs'
+
+
+def object_key(content_hash, settings):
+    """ Returns the key of an image in the store, the hash of the source content and all settings changing the image.
+    """
+    key = hashlib.sha1(content_hash.encode('utf-8'))
+    key.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+
+    return key.hexdigest()
+
+
+def object_path(store_path, key, ext):
+    return os.path.join(store_path, OBJECTS_DIR, key[:2], '{}.{}'.format(key, ext))
+
+
+def store_image(store_path, key, src, dst, mode='copy', transcode_options=None, geometry=None, histogram=False):
+    """ Puts an image into the store, unless it is already stored, and links dst to the stored image. The image is
+    created in a temporary file and renamed, so concurrent runs never see partial images.
+    :param store_path: Path of the image store
+    :param key: Key of the image, see object_key
+    :param src: Source image
+    :param dst: Destination image in an output dir, hard linked to the stored image (symlinked across file systems)
+    :param mode: Materialize mode used to put a copied image into the store
+    :param transcode_options: Codec options when the image is transcoded, None for a copy
+    :param geometry: Geometry when the image is resized, see util.resize.resize_array
+    :param histogram: Computes the histogram of a transcoded source image when set, see
+                      util.image_pipeline.process_image
+    :return: Tuple of source and stored size in bytes and the histogram (None when the image was already stored)
+    """
+    ext = os.path.splitext(dst)[1][1:]
+    stored = object_path(store_path, key, ext)
+    image_histogram = None
+
+    if not os.path.isfile(stored):
+        object_dir = create_dir(os.path.dirname(stored))
+        fd, tmp_file = tempfile.mkstemp(prefix='.', suffix='.' + ext, dir=object_dir)
+        os.close(fd)
+
+        try:
+            if transcode_options is None:
+                materialize_file(src, tmp_file, mode)
+            else:
+                image_histogram = process_image(src, tmp_file, transcode_options, geometry, histogram)[2]
+
+            os.replace(tmp_file, stored)
+        finally:
+            if os.path.lexists(tmp_file):
+                os.remove(tmp_file)
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(stored, dst)
+    except OSError:
+        materialize_file(stored, dst, 'symlink')
+
+    return os.path.getsize(src), os.path.getsize(stored), image_histogram
+
+
+def _refs_file(store_path, set_dir):
+    set_dir = os.path.abspath(set_dir)
+    return os.path.join(store_path, REFS_DIR, hashlib.sha1(set_dir.encode('utf-8')).hexdigest()[:16] + '.json')
+
+
+def write_refs(store_path, set_dir, keys):
+    """ Records the stored images referenced by an output set dir, see collect_garbage.
+    """
+    refs_file = _refs_file(store_path, set_dir)
+    create_dir(os.path.dirname(refs_file))
+
+    tmp_file = refs_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'set_dir': os.path.abspath(set_dir), 'objects': sorted(set(keys))}, f)
+
+    os.replace(tmp_file, refs_file)
+
+
+def collect_garbage(store_path, is_alive, dry_run=False):
+    """ Removes the references of deleted output set dirs and all stored images which are not referenced anymore.
+    :param store_path: Path of the image store
+    :param is_alive: Function set dir -> bool, False when the references of the set dir are outdated
+    :param dry_run: Only counts when set
+    :return: Tuple of the number of removed references, removed images and freed bytes
+    """
+    refs_dir = os.path.join(store_path, REFS_DIR)
+    referenced = set()
+    removed_refs = 0
+
+    for refs_file in sorted(os.listdir(refs_dir)) if os.path.isdir(refs_dir) else []:
+        if not refs_file.endswith('.json'):
+            continue
+
+        refs_file = os.path.join(refs_dir, refs_file)
+        with open(refs_file) as f:
+            refs = json.load(f)
+
+        if is_alive(refs['set_dir']):
+            referenced.update(refs['objects'])
+        else:
+            removed_refs += 1
+            if not dry_run:
+                os.remove(refs_file)
+
+    removed_objects = 0
+    freed_bytes = 0
+
+    for root, _, filenames in os.walk(os.path.join(store_path, OBJECTS_DIR)):
+        for filename in filenames:
+            # Temporary files of running conversions start with a dot
+            if filename.startswith('.') or os.path.splitext(filename)[0] in referenced:
+                continue
+
+            path = os.path.join(root, filename)
+            removed_objects += 1
+            freed_bytes += os.path.getsize(path)
+
+            if not dry_run:
+                os.remove(path)
+
+    return removed_refs, removed_objects, freed_bytes
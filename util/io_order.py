@@ -0,0 +1,117 @@
+import os
+import struct
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+IO_ORDERS = ['logical', 'inode', 'extent']
+
+# Number of files hinted ahead of the file currently read
+READAHEAD_WINDOW = 32
+
+# ioctl request and struct sizes for the extent map of a file (linux/fiemap.h)
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+
+def physical_offset(path):
+    """ Returns the physical offset of the first extent of a file on its device, None when unknown.
+    """
+    if fcntl is None:
+        return None
+
+    buffer = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+    FIEMAP_HEADER.pack_into(buffer, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, FS_IOC_FIEMAP, buffer, True)
+        finally:
+            os.close(fd)
+    except OSError:
+        return None
+
+    if FIEMAP_HEADER.unpack_from(buffer, 0)[3] == 0:
+        return None
+
+    return FIEMAP_EXTENT.unpack_from(buffer, FIEMAP_HEADER.size)[1]
+
+
+def disk_order(paths, io_order='logical', entries=None):
+    """ Returns the order in which the files are read with the least seeks.
+    :param paths: Files to read
+    :param io_order: 'logical' keeps the given order, 'inode' sorts by device and inode number, 'extent' by device and
+                     physical offset of the first extent (files without extent map are sorted by inode after them)
+    :param entries: Optional list of os.DirEntry (or None) aligned with paths to avoid additional stat calls
+    :return: Array of indices into paths
+    """
+    if io_order == 'logical' or len(paths) == 0:
+        return np.arange(len(paths), dtype=np.int64)
+
+    devices = np.empty(len(paths), dtype=np.uint64)
+    unknown = np.zeros(len(paths), dtype=bool)
+    positions = np.empty(len(paths), dtype=np.uint64)
+
+    for i, path in enumerate(paths):
+        entry = None if entries is None else entries[i]
+        stat = os.stat(path) if entry is None else entry.stat()
+
+        devices[i] = stat.st_dev
+        offset = physical_offset(path) if io_order == 'extent' else None
+
+        if offset is None:
+            unknown[i] = io_order == 'extent'
+            positions[i] = stat.st_ino
+        else:
+            positions[i] = offset
+
+    return np.lexsort((positions, unknown, devices)).astype(np.int64)
+
+
+def readahead(path):
+    """ Hints the kernel to read a file into the page cache in the background.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def with_readahead(hint, function, *args):
+    """ Hints the kernel to read the file hint (if not None) and returns function(*args). Used for pool tasks, so every
+    task keeps the readahead one window ahead.
+    """
+    if hint is not None:
+        readahead(hint)
+
+    return function(*args)
+
+
+class Readahead:
+    """ Keeps the readahead hints a window of files ahead of the files already read.
+    """
+
+    def __init__(self, paths, window=READAHEAD_WINDOW):
+        self.paths = paths
+        self.window = window
+        self.hinted = 0
+
+    def advance(self, num_read):
+        end = min(len(self.paths), num_read + self.window)
+
+        while self.hinted < end:
+            readahead(self.paths[self.hinted])
+            self.hinted += 1
@@ -0,0 +1,82 @@
+import numpy as np
+
+from util.annotation_store import AnnotationStore
+from util.file_cache import FileCache
+
+
+class LabelCache(FileCache):
+    """ Persistent cache of parsed label files, see util.file_cache.FileCache.
+
+    The cache holds the columns of an AnnotationStore, row r holds the objects of the cached file r. Label files whose
+    size or mtime changed since the last run are parsed again, all others are taken from the cache.
+    """
+
+    version = 2
+    name = 'Label cache'
+    path_name = 'label dir'
+    path_key = 'label_path'
+
+    def __init__(self, cache_file, label_path):
+        super().__init__(cache_file, label_path)
+
+        self.annotations = AnnotationStore.from_records([])
+
+    def load_annotations(self, label_files, workers=1, errors=None, io_order='logical'):
+        """ Returns an AnnotationStore for the given label files, only changed or new files are parsed.
+
+        See AnnotationStore.from_label_files for errors, invalid label files are not cached.
+        """
+        self._load()
+
+        stats = self.stat(label_files)
+        misses = self.misses(label_files, stats)
+
+        print('\nLabel cache: {} of {} label files up to date.'.format(len(label_files) - len(misses),
+                                                                       len(label_files)))
+
+        if len(misses) == 0:
+            return self.annotations.take(self.rows(label_files))
+
+        num_errors = 0 if errors is None else len(errors)
+        parsed = AnnotationStore.from_label_files(self.path, [label_files[i] for i in misses], workers, errors,
+                                                  io_order)
+
+        # Invalid label files are not cached
+        failed = set() if errors is None else set(label_file for label_file, _, _ in errors[num_errors:])
+        valid = np.array([label_files[i] not in failed for i in misses], dtype=bool)
+
+        # Changed files keep their row, new files are appended. Entries of files not requested in this run are kept,
+        # e.g. when using file lists.
+        valid_misses = [i for i, is_valid in zip(misses, valid.tolist()) if is_valid]
+
+        num_cached = len(self.files)
+        rows = self._add_rows([label_files[i] for i in valid_misses], [stats[i] for i in valid_misses])
+
+        source = np.arange(len(self.files), dtype=np.int64)
+        source[rows] = num_cached + np.arange(len(rows), dtype=np.int64)
+
+        self.annotations = AnnotationStore.concatenate([self.annotations,
+                                                        parsed.take(np.flatnonzero(valid))]).take(source)
+        self._save()
+
+        if valid.all():
+            return self.annotations.take(self.rows(label_files))
+
+        # Invalid label files are taken from the parsed files, stored without objects
+        positions = {label_files[i]: position for position, i in enumerate(misses)}
+        result_rows = np.array([len(self.files) + positions[label_file] if label_file in failed else
+                                self.index[label_file] for label_file in label_files], dtype=np.int64)
+
+        return AnnotationStore.concatenate([self.annotations, parsed]).take(result_rows)
+
+    def _from_arrays(self, arrays):
+        annotations = AnnotationStore.from_arrays(arrays)
+        super()._from_arrays(arrays)
+
+        self.annotations = annotations
+
+    def _to_arrays(self):
+        arrays = super()._to_arrays()
+        arrays.update(self.annotations.to_arrays())
+
+        return arrays
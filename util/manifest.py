@@ -0,0 +1,70 @@
+import json
+import os
+
+MANIFEST_FILE = '.image_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def load_manifest(set_dir, settings):
+    """ Loads the manifest of an output set dir.
+    :param set_dir: Output set dir
+    :param settings: Dict of all settings which change the written images (e.g. filetype, codec options)
+    :return: Dict destination file -> [source file, size, mtime_ns], all entries are marked outdated (empty dict) when
+             the manifest is missing or was written with other settings
+    """
+    manifest_file = os.path.join(set_dir, MANIFEST_FILE)
+
+    if not os.path.isfile(manifest_file):
+        return {}
+
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('settings') != settings:
+        # Images written with other settings are rewritten, but still known so stale ones can be removed
+        return {image: None for image in manifest.get('images', {})}
+
+    return manifest.get('images', {})
+
+
+def list_files(set_dir):
+    """ Returns the paths of all files in a set dir (including fan-out sub dirs) relative to the set dir.
+    """
+    files = set()
+
+    for root, _, filenames in os.walk(set_dir):
+        rel_root = os.path.relpath(root, set_dir)
+        files.update(filename if rel_root == '.' else os.path.join(rel_root, filename) for filename in filenames)
+
+    files.discard(MANIFEST_FILE)
+
+    return files
+
+
+def diff_manifest(manifest, planned, existing):
+    """ Compares the manifest with the planned images of a set.
+    :param manifest: Dict destination file -> entry of the last run
+    :param planned: Dict destination file -> [source file, size, mtime_ns] of this run
+    :param existing: Set of files in the set dir
+    :return: Tuple of the destination files to write and the stale destination files to remove
+    """
+    changed = [image for image, entry in planned.items()
+               if image not in existing or manifest.get(image) != entry]
+    stale = [image for image in manifest if image not in planned and image in existing]
+
+    return changed, stale
+
+
+def save_manifest(set_dir, settings, images):
+    """ Writes the manifest atomically, images is a dict destination file -> [source file, size, mtime_ns].
+    """
+    manifest_file = os.path.join(set_dir, MANIFEST_FILE)
+    tmp_file = manifest_file + '.tmp'
+
+    with open(tmp_file, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'settings': settings, 'images': images}, f)
+
+    os.replace(tmp_file, manifest_file)
@@ -0,0 +1,102 @@
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MODES = ['copy', 'hardlink', 'symlink', 'reflink']
+
+# ioctl request to share the extents of a file (linux/fs.h), supported e.g. by Btrfs, XFS and OCFS2
+FICLONE = 0x40049409
+
+# Errors meaning that the file system (or the combination of source and destination) does not support a mode
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS,
+                      errno.EINVAL, errno.ENOTTY, errno.EMLINK, errno.EBADF}
+
+# (mode, source device, destination device) combinations which already failed, they are not tried again
+_unsupported = set()
+
+
+def materialize_file(src, dst, mode='copy'):
+    """ Creates dst with the content of src. Modes which are not supported between the two file systems fall back to
+    a kernel side copy (copy_file_range) and finally to a normal copy.
+    :param src: Source file
+    :param dst: Destination file, an existing file or (dangling) link is replaced
+    :param mode: One of MODES
+    :return: Mode actually used
+    """
+
+    _remove(dst)
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(os.path.abspath(dst))).st_dev)
+
+    for fallback in _fallbacks(mode):
+        if (fallback,) + devices in _unsupported:
+            continue
+
+        try:
+            _MATERIALIZERS[fallback](src, dst)
+            return fallback
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRORS:
+                raise
+
+            _unsupported.add((fallback,) + devices)
+            _remove(dst)
+
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def _fallbacks(mode):
+    if mode == 'copy':
+        return ['copy_file_range']
+    if mode == 'reflink':
+        return ['reflink', 'copy_file_range']
+
+    return [mode, 'copy_file_range']
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _symlink(src, dst):
+    os.symlink(os.path.abspath(src), dst)
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, 'Reflinks are not supported on this platform')
+
+    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+
+
+def _copy_file_range(src, dst):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'copy_file_range is not available')
+
+    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        remaining = os.fstat(f_src.fileno()).st_size
+
+        while remaining > 0:
+            copied = os.copy_file_range(f_src.fileno(), f_dst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+
+
+_MATERIALIZERS = {
+    'hardlink': _hardlink,
+    'symlink': _symlink,
+    'reflink': _reflink,
+    'copy_file_range': _copy_file_range,
+}
+
+
+def _remove(path):
+    if os.path.lexists(path):
+        os.remove(path)
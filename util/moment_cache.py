@@ -0,0 +1,171 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+from util.file_cache import FileCache
+from util.image_stats import histogram_moments, image_histogram
+from util.io_order import disk_order, with_readahead, READAHEAD_WINDOW
+
+# Number of images added to the cache at once while converting, bounds the memory of images not yet added
+ADD_BATCH = 4096
+
+
+def _decode(task):
+    return with_readahead(*task)
+
+
+def image_moments(path):
+    """ Decodes an image and returns its pixel count, sums and squares (see util.image_stats.histogram_moments), None
+    when the image could not be read.
+    """
+    histogram = image_histogram(path)
+
+    return None if histogram is None else histogram_moments(histogram)
+
+
+class MomentCache(FileCache):
+    """ Persistent cache of the pixel moments of every image, see util.file_cache.FileCache.
+
+    The cache holds the pixel count and the per channel (RGB) sum and sum of squares of every image, 56 bytes per image.
+    Only new or changed images are decoded on an update, the exact mean and std of any set or split are derived from
+    the sum of the cached moments. Images which could not be read have a pixel count of -1.
+
+    With histograms the cache also holds the per channel histogram of every image (see
+    util.image_stats.empty_histogram), needed for percentiles and clipping. They take about 3 KB (3 x 256 uint32) per
+    image in memory, 600 MB for 200k images. A cache file without histograms is rebuilt when they are needed, the
+    histograms of a cache file are dropped when it is saved without them. Every save rewrites the whole compressed
+    file, so the cache is saved once per conversion.
+    """
+
+    version = 4
+    name = 'Moment cache'
+    path_name = 'image dir'
+    path_key = 'image_path'
+    indent = '\t'
+
+    def __init__(self, cache_file, image_path, histograms=False):
+        super().__init__(cache_file, image_path)
+
+        self.columns = ['count', 'sums', 'squares'] + (['histograms'] if histograms else [])
+
+        self.count = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, 3), dtype=np.int64)
+        self.squares = np.zeros((0, 3), dtype=np.int64)
+        self.histograms = np.zeros((0, 3, 256), dtype=np.uint32) if histograms else None
+
+        self.pending = []
+
+    def add(self, image_file, stat, histogram):
+        """ Adds an image decoded while converting, so it is not decoded again. The images are added in batches of
+        ADD_BATCH and saved with the next update or save.
+        :param image_file: Image file relative to the image path
+        :param stat: Tuple of byte size and mtime (ns) of the image
+        :param histogram: Histogram of the image, see util.image_stats.empty_histogram
+        """
+        self.pending.append((image_file, stat, histogram_moments(histogram) if self.histograms is None else
+                             histogram.astype(np.uint32)))
+
+        if len(self.pending) >= ADD_BATCH:
+            self._add_pending()
+
+    def save(self):
+        """ Saves the cache when images were added since the last save.
+        """
+        if len(self.pending) > 0:
+            self._add_pending()
+            self._save()
+
+    def update(self, image_files, workers=1, io_order='logical'):
+        """ Decodes new and changed images, adds their histograms to the cache and saves it.
+        :param image_files: Image files relative to the image path
+        :param workers: Number of processes used to decode new or changed images
+        :param io_order: Order in which the images are decoded, see util.io_order.disk_order
+        :return: Rows of the image files in the cache
+        """
+        self.save()
+        self._load()
+
+        stats = self.stat(image_files)
+        misses = self.misses(image_files, stats)
+
+        print('\tMoment cache: {} of {} images up to date.'.format(len(image_files) - len(misses), len(image_files)))
+
+        if len(misses) > 0:
+            time.sleep(0.1)
+            print('\tDecoding new or changed images ...')
+            time.sleep(0.1)
+
+            paths = [os.path.join(self.path, image_files[i]) for i in misses]
+            order = disk_order(paths, io_order).tolist()
+            misses = [misses[i] for i in order]
+            paths = [paths[i] for i in order]
+
+            # Every task hints the image a window ahead
+            hints = paths[READAHEAD_WINDOW:] + [None] * min(READAHEAD_WINDOW, len(paths)) \
+                if io_order != 'logical' else [None] * len(paths)
+            decode = image_moments if self.histograms is None else image_histogram
+            tasks = [(hint, decode, path) for hint, path in zip(hints, paths)]
+
+            if workers > 1 and len(paths) > 1:
+                chunksize = max(1, min(256, len(paths) // (workers * 8)))
+                with multiprocessing.Pool(workers) as pool:
+                    results = list(tqdm(pool.imap(_decode, tasks, chunksize=chunksize),
+                                        total=len(paths), unit='files', desc='\tProgress'))
+            else:
+                results = [_decode(task) for task in tqdm(tasks, unit='files', desc='\tProgress')]
+
+            self._add([image_files[i] for i in misses], [stats[i] for i in misses], results)
+            self._save()
+
+        return self.rows(image_files)
+
+    def moments(self, rows):
+        """ Returns the summed pixel count, sums and squares of the rows (see util.image_stats.histogram_moments) and
+        the rows of unreadable images.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        readable = rows[self.count[rows] >= 0]
+
+        return (int(self.count[readable].sum()), self.sums[readable].sum(axis=0), self.squares[readable].sum(axis=0),
+                rows[self.count[rows] < 0])
+
+    def histogram(self, rows):
+        """ Returns the summed histogram of the readable rows, see util.image_stats.empty_histogram. Needs a cache
+        with histograms.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+
+        return self.histograms[rows[self.count[rows] >= 0]].sum(axis=0, dtype=np.int64)
+
+    def _add_pending(self):
+        self._load()
+        self._add([image_file for image_file, _, _ in self.pending], [stat for _, stat, _ in self.pending],
+                  [histogram for _, _, histogram in self.pending])
+        self.pending = []
+
+    def _add(self, image_files, stats, results):
+        rows = self._add_rows(image_files, stats)
+
+        for row, result in zip(rows.tolist(), results):
+            if result is None:
+                self.count[row] = -1
+                self.sums[row] = self.squares[row] = 0
+                if self.histograms is not None:
+                    self.histograms[row] = 0
+                continue
+
+            if self.histograms is not None:
+                self.histograms[row] = result
+                result = histogram_moments(result)
+
+            self.count[row], self.sums[row], self.squares[row] = result
+
+    def _from_arrays(self, arrays):
+        if self.histograms is not None and 'histograms' not in arrays:
+            print('\tMoment cache holds no histograms, rebuilding it.')
+            return
+
+        super()._from_arrays(arrays)
@@ -0,0 +1,131 @@
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from tabulate import tabulate
+
+from util.util import create_dir
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Severity of every check, errors stop the conversion
+CHECKS = {
+    'not_well_formed': ERROR,
+    'invalid_structure': ERROR,
+    'non_integer_class_id': ERROR,
+    'unknown_class_id': ERROR,
+    'bbox_outside_image': WARNING,
+    'degenerate_bbox': WARNING,
+    'image_size_mismatch': WARNING,
+}
+
+
+def check_annotations(annotations, index, label_path, known_ids, parse_errors, image_sizes=None):
+    """ Checks all label files of an AnnotationStore at once.
+    :param annotations: AnnotationStore, the rows are the stem ids of index
+    :param index: DatasetIndex of the label files, see util.dataset_index
+    :param label_path: Dir of the label files
+    :param known_ids: Bool array, True for every label map id which is converted without error
+    :param parse_errors: List of (label_file, check, message) tuples of label files which could not be read
+    :param image_sizes: Optional tuple of width and height arrays of the images (e.g. from the image catalog) in the
+                        order of the annotation store rows, -1 for unknown sizes
+    :return: List of issues, each issue is a dict with label_file, severity, check and message
+    """
+
+    def label_file_path(row):
+        return os.path.join(label_path, index.label_file(row))
+
+    issues = [_issue(os.path.join(label_path, label_file), check, message)
+              for label_file, check, message in parse_errors]
+
+    if image_sizes is not None:
+        image_width, image_height = image_sizes
+        unparsed = set(label_file for label_file, _, _ in parse_errors)
+
+        mismatch = (image_width >= 0) & ((annotations.width != image_width) | (annotations.height != image_height))
+
+        for row in np.flatnonzero(mismatch).tolist():
+            # Label files which could not be read are stored without size
+            if index.label_file(row) in unparsed:
+                continue
+
+            issues.append(_issue(label_file_path(row), 'image_size_mismatch',
+                                 'Size {}x{} in label file does not match image size {}x{}.'.format(
+                                     int(annotations.width[row]), int(annotations.height[row]),
+                                     int(image_width[row]), int(image_height[row]))))
+
+    label_ids = annotations.class_id
+    known = np.zeros(len(label_ids), dtype=bool)
+    in_table = label_ids < len(known_ids)
+    known[in_table] = known_ids[label_ids[in_table]]
+
+    width = annotations.width[annotations.image]
+    height = annotations.height[annotations.image]
+    xmin, ymin, xmax, ymax = annotations.xmin, annotations.ymin, annotations.xmax, annotations.ymax
+
+    checks = [
+        ('unknown_class_id', ~known),
+        ('bbox_outside_image', (xmin < 0) | (ymin < 0) | (xmax > width) | (ymax > height)),
+        ('degenerate_bbox', (xmax <= xmin) | (ymax <= ymin)),
+    ]
+
+    for check, failed in checks:
+        for i in np.flatnonzero(failed).tolist():
+            row = int(annotations.image[i])
+            bbox = [int(xmin[i]), int(ymin[i]), int(xmax[i]), int(ymax[i])]
+
+            if check == 'unknown_class_id':
+                message = 'Class ID {} not in label map or not included.'.format(int(label_ids[i]) - 1)
+            elif check == 'bbox_outside_image':
+                message = 'Bounding box {} outside of image size {}x{}.'.format(bbox, int(annotations.width[row]),
+                                                                              int(annotations.height[row]))
+            else:
+                message = 'Bounding box {} has no area.'.format(bbox)
+
+            issue = _issue(label_file_path(row), check, message)
+            issue['object'] = i - int(annotations.box_offsets[row])
+            issue['class_id'] = int(label_ids[i]) - 1
+            issue['bbox'] = bbox
+
+            issues.append(issue)
+
+    return issues
+
+
+def _issue(label_file, check, message):
+    return {'label_file': label_file, 'severity': CHECKS[check], 'check': check, 'message': message}
+
+
+def write_report(report_file, issues, num_label_files, num_objects):
+    counts = Counter(issue['check'] for issue in issues)
+
+    report = {
+        'label_files': num_label_files,
+        'objects': num_objects,
+        'errors': sum(1 for issue in issues if issue['severity'] == ERROR),
+        'warnings': sum(1 for issue in issues if issue['severity'] == WARNING),
+        'checks': {check: counts.get(check, 0) for check in CHECKS},
+        'issues': issues
+    }
+
+    create_dir(os.path.dirname(os.path.abspath(report_file)))
+
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=4)
+        f.write("\n")
+
+    return report
+
+
+def print_report(report, tablefmt):
+    print('\nPre-flight check of {} label files with {} objects: {} errors, {} warnings.'.format(
+        report['label_files'], report['objects'], report['errors'], report['warnings']))
+
+    rows = [(check, CHECKS[check], num) for check, num in report['checks'].items() if num > 0]
+    if len(rows) > 0:
+        print(tabulate(rows, headers=['check', 'severity', 'count'], tablefmt=tablefmt))
+
+    for issue in [issue for issue in report['issues'] if issue['severity'] == ERROR][:10]:
+        print('\t{}: {}'.format(issue['label_file'], issue['message']))
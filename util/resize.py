@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+
+# Padding color of letterboxed images (BGR), the gray also used by the YOLO loaders
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+def resize_settings(args):
+    """ Returns the resize settings of the parsed arguments, None when the images keep their size.
+    """
+    if args.resize is None and args.max_side is None:
+        return None
+
+    return {'size': args.resize, 'max_side': args.max_side, 'letterbox': args.letterbox}
+
+
+def resize_geometry(width, height, settings):
+    """ Computes how every image is resized.
+    :param width: Array of image widths
+    :param height: Array of image heights
+    :param settings: Dict with size ([width, height] or None), max_side (or None) and letterbox
+    :return: Dict of arrays: scale_x, scale_y, pad_x and pad_y map original to output coordinates, resized_width and
+             resized_height are the size of the scaled image, width and height the output size including padding
+    """
+    width = np.maximum(width, 1).astype(np.float64)
+    height = np.maximum(height, 1).astype(np.float64)
+
+    if settings['max_side'] is not None:
+        scale = np.minimum(1.0, settings['max_side'] / np.maximum(width, height))
+        resized_width = np.maximum(1, np.rint(width * scale)).astype(np.int64)
+        resized_height = np.maximum(1, np.rint(height * scale)).astype(np.int64)
+        output_width, output_height = resized_width, resized_height
+    elif settings['letterbox']:
+        scale = np.minimum(settings['size'][0] / width, settings['size'][1] / height)
+        resized_width = np.maximum(1, np.rint(width * scale)).astype(np.int64)
+        resized_height = np.maximum(1, np.rint(height * scale)).astype(np.int64)
+        output_width = np.full(len(width), settings['size'][0], dtype=np.int64)
+        output_height = np.full(len(height), settings['size'][1], dtype=np.int64)
+    else:
+        resized_width = np.full(len(width), settings['size'][0], dtype=np.int64)
+        resized_height = np.full(len(height), settings['size'][1], dtype=np.int64)
+        output_width, output_height = resized_width, resized_height
+
+    return {'scale_x': resized_width / width,
+            'scale_y': resized_height / height,
+            'pad_x': (output_width - resized_width) // 2,
+            'pad_y': (output_height - resized_height) // 2,
+            'resized_width': resized_width,
+            'resized_height': resized_height,
+            'width': output_width,
+            'height': output_height}
+
+
+def image_geometry(geometry, row):
+    """ Returns the geometry of one image as tuple of ints, so it can be sent to worker processes.
+    """
+    return tuple(int(geometry[key][row]) for key in ['resized_width', 'resized_height', 'pad_x', 'pad_y', 'width',
+                                                     'height'])
+
+
+def resize_array(image, geometry):
+    """ Resizes (and letterboxes) a decoded image.
+    :param image: Image as uint8 array (height, width, 3)
+    :param geometry: Tuple (resized width, resized height, pad x, pad y, output width, output height)
+    :return: Resized image
+    """
+    resized_width, resized_height, pad_x, pad_y, width, height = geometry
+
+    interpolation = cv2.INTER_AREA if resized_width < image.shape[1] else cv2.INTER_LINEAR
+    image = cv2.resize(image, (resized_width, resized_height), interpolation=interpolation)
+
+    if (width, height) != (resized_width, resized_height):
+        image = cv2.copyMakeBorder(image, pad_y, height - resized_height - pad_y, pad_x, width - resized_width - pad_x,
+                                   cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+
+    return image
@@ -0,0 +1,70 @@
+import os
+
+import cv2
+from PIL import Image
+
+BACKENDS = ['pil', 'cv2']
+CHROMA_SUBSAMPLING = ['4:4:4', '4:2:2', '4:2:0']
+
+# Subsampling values of the PIL JPEG encoder
+PIL_SUBSAMPLING = {'4:4:4': 0, '4:2:2': 1, '4:2:0': 2}
+
+CV2_SUBSAMPLING = {'4:4:4': 'IMWRITE_JPEG_SAMPLING_FACTOR_444',
+                   '4:2:2': 'IMWRITE_JPEG_SAMPLING_FACTOR_422',
+                   '4:2:0': 'IMWRITE_JPEG_SAMPLING_FACTOR_420'}
+
+
+def transcode_options(args):
+    """ Returns the codec options of the parsed arguments as plain dict, so they can be sent to worker processes.
+    """
+    return {'backend': args.transcode_backend,
+            'jpeg_quality': args.jpeg_quality,
+            'png_compression': args.png_compression,
+            'chroma_subsampling': args.chroma_subsampling}
+
+
+def encode_image(image, dst, options):
+    """ Encodes a decoded BGR image in the format given by the extension of dst.
+    :param image: Image as uint8 array (height, width, 3) in BGR order
+    :param dst: Destination image
+    :param options: Dict with backend, jpeg_quality, png_compression and chroma_subsampling (None for the codec default)
+    """
+    ext = os.path.splitext(dst)[1].lower()
+
+    if options['backend'] == 'cv2' and ext in ('.jpg', '.jpeg', '.png'):
+        write_image(image, dst, options)
+    else:
+        _save_pil(Image.fromarray(image[:, :, ::-1]), dst, ext, options)
+
+
+def _save_pil(image, dst, ext, options):
+    params = {}
+
+    if ext in ('.jpg', '.jpeg'):
+        params['quality'] = options['jpeg_quality']
+        if options['chroma_subsampling'] is not None:
+            params['subsampling'] = PIL_SUBSAMPLING[options['chroma_subsampling']]
+    elif ext == '.png':
+        params['compress_level'] = options['png_compression']
+
+    image.save(dst, **params)
+
+
+def write_image(image, dst, options):
+    """ Encodes a BGR image with OpenCV (libjpeg-turbo, libpng) and the codec options in the format given by the
+    extension of dst.
+    """
+    ext = os.path.splitext(dst)[1].lower()
+    params = []
+
+    if ext == '.png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, options['png_compression']]
+    elif ext in ('.jpg', '.jpeg'):
+        params = [cv2.IMWRITE_JPEG_QUALITY, options['jpeg_quality']]
+
+        subsampling = options['chroma_subsampling']
+        if subsampling is not None and hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):
+            params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, getattr(cv2, CV2_SUBSAMPLING[subsampling])]
+
+    if not cv2.imwrite(dst, image, params):
+        raise OSError('Image could not be written: {}'.format(dst))
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import time
 
@@ -12,16 +13,40 @@ def create_dir(path):
     return path
 
 
-def validate_match(image_sets, images, label):
-    valid = True
+def create_fan_out_dirs(path, files):
+    """ Creates the sub dirs of all files (relative to path) once.
+    """
+    for sub_dir in {os.path.dirname(file) for file in files}:
+        if sub_dir != '':
+            create_dir(os.path.join(path, sub_dir))
 
-    for s in image_sets:
-        image_list = [file[:-4] for file in images[s]]
-        label_list = [file[:-4] for file in label[s]]
 
-        valid = valid and sorted(image_list) == sorted(label_list)
+def remove_empty_fan_out_dirs(path, files):
+    """ Removes the sub dirs of the given files (relative to path) which are empty, deepest dirs first.
+    """
+    sub_dirs = set()
+    for file in files:
+        sub_dir = os.path.dirname(file)
 
-    return valid
+        while sub_dir != '':
+            sub_dirs.add(sub_dir)
+            sub_dir = os.path.dirname(sub_dir)
+
+    for sub_dir in sorted(sub_dirs, key=lambda d: d.count(os.sep), reverse=True):
+        sub_dir = os.path.join(path, sub_dir)
+
+        if os.path.isdir(sub_dir) and len(os.listdir(sub_dir)) == 0:
+            os.rmdir(sub_dir)
+
+
+def default_cache_file(path, suffix=''):
+    """ Returns the default cache file for a label or image dir inside the user cache dir.
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    path = os.path.abspath(path)
+    key = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+
+    return os.path.join(cache_dir, 'data_converter', '{}_{}{}.npz'.format(os.path.basename(path), key, suffix))
 
 
 def print_label_stats(output_path, id2cat, max_classes, excluded_classes, df, set_title, tablefmt):
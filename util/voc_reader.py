@@ -0,0 +1,123 @@
+import re
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+_ROOT = re.compile(rb'<annotation\b([^>]*)>')
+_ENCODING = re.compile(rb'<\?xml[^>]*encoding\s*=\s*["\']([^"\']+)["\']')
+_VERIFIED = re.compile(rb'\sverified\s*=')
+_FILENAME = re.compile(rb'<filename>([^<]*)</filename>')
+_SIZE = re.compile(rb'<size>\s*<width>(\d+)</width>\s*<height>(\d+)</height>')
+_OBJECT_START = re.compile(rb'<object>')
+_OBJECT = re.compile(rb'<object>\s*'
+                     rb'<name>(\d+)</name>\s*'
+                     rb'<pose>[^<]*</pose>\s*'
+                     rb'<truncated>[^<]*</truncated>\s*'
+                     rb'<difficult>[^<]*</difficult>\s*'
+                     rb'<bndbox>\s*'
+                     rb'<xmin>(-?\d+)</xmin>\s*'
+                     rb'<ymin>(-?\d+)</ymin>\s*'
+                     rb'<xmax>(-?\d+)</xmax>\s*'
+                     rb'<ymax>(-?\d+)</ymax>\s*'
+                     rb'</bndbox>\s*'
+                     rb'</object>')
+
+# Constructs the fast path does not handle, files containing one of them are read with ElementTree
+_UNUSUAL = (b'&', b'<!--', b'<![CDATA[', b'<!DOCTYPE')
+
+
+class ClassIdError(ValueError):
+    pass
+
+
+def read_label_file(label_file):
+    """ Reads the fields used by the converters from a Pascal VOC label file.
+
+    Label files written by LabelImg are read with a byte level fast path, all other files are read with ElementTree.
+    :param label_file: Path to the label file
+    :return: Tuple of filename, width, height, verified flag and a list of objects.
+             Each object is a tuple (class_id, xmin, ymin, xmax, ymax), the class id is already shifted to the
+             label map id (label file id + 1).
+    """
+
+    with open(label_file, 'rb') as f:
+        data = f.read()
+
+    result = _read_fast(data)
+
+    if result is None:
+        return read_label_file_etree(label_file)
+
+    return result
+
+
+def read_label_file_etree(label_file):
+    """ Reads a Pascal VOC label file with ElementTree, returns the same fields as read_label_file.
+    """
+
+    xml_tree = ET.parse(label_file).getroot()
+
+    filename = xml_tree.find('filename').text
+    width = int(xml_tree.find('size')[0].text)
+    height = int(xml_tree.find('size')[1].text)
+
+    objects = []
+    for member in xml_tree.findall('object'):
+        if not str(member[0].text).isdigit():
+            raise ClassIdError('Class ID \'{}\' not convertible to integer. Found in label file: {}'.format(
+                member[0].text, label_file))
+
+        objects.append((int(member[0].text) + 1,
+                        int(member[4][0].text), int(member[4][1].text),
+                        int(member[4][2].text), int(member[4][3].text)))
+
+    return filename, width, height, "verified" in xml_tree.attrib, objects
+
+
+def _read_fast(data):
+    """ Returns None when the data does not have the layout written by LabelImg or is not well-formed, e.g. a
+    truncated file, so ElementTree reads it and raises the parse error.
+    """
+
+    if any(token in data for token in _UNUSUAL):
+        return None
+
+    encoding = _ENCODING.search(data)
+    if encoding is not None and encoding.group(1).lower() not in (b'utf-8', b'utf8', b'ascii'):
+        return None
+
+    if not _well_formed(data):
+        return None
+
+    root = _ROOT.search(data)
+    filename = _FILENAME.search(data)
+    size = _SIZE.search(data)
+
+    if root is None or filename is None or size is None:
+        return None
+
+    objects = [(int(class_id) + 1, int(xmin), int(ymin), int(xmax), int(ymax))
+               for class_id, xmin, ymin, xmax, ymax in _OBJECT.findall(data)]
+
+    # Objects with additional or reordered children
+    if len(objects) != len(_OBJECT_START.findall(data)):
+        return None
+
+    try:
+        filename = filename.group(1).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+    return (filename, int(size.group(1)), int(size.group(2)), _VERIFIED.search(root.group(1)) is not None,
+            objects)
+
+
+def _well_formed(data):
+    """ Checks the data with expat, the parser of ElementTree, without building a tree.
+    """
+
+    try:
+        expat.ParserCreate().Parse(data, True)
+    except expat.ExpatError:
+        return False
+
+    return True